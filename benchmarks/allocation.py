@@ -0,0 +1,42 @@
+"""
+Latency of core.allocation.allocate on synthetic books:
+
+    python -m benchmarks.allocation --venues 10 --levels 50
+"""
+import argparse
+import time
+
+import numpy as np
+
+from core.allocation import allocate
+
+
+def main(venues: int, levels: int, runs: int) -> None:
+    rng = np.random.default_rng(0)
+    books = {
+        f'VENUE_{i}': np.column_stack([100 + np.cumsum(rng.random(levels) * 0.1), rng.random(levels)])
+        for i in range(venues)
+    }
+    fees = {venue: 0.0005 for venue in books}
+    shifts = {venue: rng.normal(0, 0.0002) for venue in books}
+    capacities = {venue: rng.random() * levels for venue in books}
+
+    timings = np.empty(runs)
+
+    for i in range(runs):
+        started = time.perf_counter()
+        allocate(books, levels / 2, 'buy', fees, shifts, capacities)
+        timings[i] = time.perf_counter() - started
+
+    p50, p99 = np.percentile(timings * 1e6, [50, 99])
+    print(f'{venues} venues x {levels} levels: p50 {p50:.0f} us, p99 {p99:.0f} us')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=10)
+    parser.add_argument('--levels', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=10000)
+    args = parser.parse_args()
+
+    main(args.venues, args.levels, args.runs)
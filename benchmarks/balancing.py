@@ -0,0 +1,144 @@
+"""
+End-to-end balancing cycles against simulated exchanges, no keys or broker needed:
+
+    python -m benchmarks.balancing --cycles 2000 --venues 3 --latency 0.002
+
+Every cycle an external fill of up to --disbalance USD lands on a random venue, then Balancing
+hedges it and its OrderTracker follows the orders to their final status. With --rest unfilled orders
+stay open and fill as the price moves, --results-every N also fetches all orders through GetOrdersResults
+every N cycles like an external requester would. --execution adaptive chases the unfilled part of every
+hedge with cancel/replace, re-quoting every --reprice-interval seconds.
+"""
+import argparse
+import asyncio
+import contextlib
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+from config import Config
+from core.client_pool import ClientPool
+from core.enums import RabbitMqQueues
+from core.metrics import Metrics
+from core.outbox import Outbox
+from core.rate_limiter import RateLimiter
+from core.session_pool import SessionPool
+from tasks.event.get_orders_results import GetOrdersResults
+from tasks.periodic.balancing import Balancing
+from tools.simulator import MemoryBroker, SimulatedExchange
+
+VENUES = ['BINANCE', 'DYDX', 'OKX', 'BITMEX', 'KRAKEN', 'APOLLOX']
+
+
+async def main(cycles: int, venues: int, latency: float, disbalance: float, volatility: float, fill_ratio: float,
+               disconnect_rate: float, rest: bool, results_every: int, execution: str, reprice_interval: float,
+               seed: int) -> None:
+    Config.EXECUTION.update(mode=execution, reprice_interval=reprice_interval)
+    rng = random.Random(seed)
+    price = 30000.0
+    shifts = {name: rng.gauss(0, 0.0002) for name in VENUES[:venues]}
+    exchanges = {
+        name: SimulatedExchange(name, latency=latency, fill_ratio=fill_ratio, disconnect_rate=disconnect_rate,
+                                price=price * (1 + shifts[name]), rest=rest, seed=seed + i)
+        for i, name in enumerate(VENUES[:venues])
+    }
+    broker = MemoryBroker()
+    metrics = Metrics()
+    app = {
+        'metrics': metrics,
+        # the simulated venues have no rate limits, Config.RATE_LIMITS of the real ones would throttle the cycles
+        'clients': ClientPool(exchanges, metrics=metrics, limiter=RateLimiter({}, metrics=metrics)),
+        'sessions': SessionPool(),
+        'publisher': broker,
+        'outbox': Outbox(broker)
+    }
+
+    latencies = np.empty(cycles)
+    residuals = np.empty(cycles)
+    fetched = {name: 0 for name in exchanges}
+    started = time.perf_counter()
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for cycle in range(cycles):
+            price *= math.exp(rng.gauss(0, volatility))
+
+            for name, exchange in exchanges.items():
+                exchange.price = price * (1 + shifts[name])
+
+            rng.choice(list(exchanges.values())).trade(rng.uniform(-disbalance, disbalance) / price)
+
+            cycle_started = time.perf_counter()
+            await Balancing(app).run({})
+            latencies[cycle] = time.perf_counter() - cycle_started
+            residuals[cycle] = abs(sum(exchange.position for exchange in exchanges.values()) * price)
+
+            if results_every and (cycle + 1) % results_every == 0:
+                batches = {name: list(exchange.orders)[fetched[name]:] for name, exchange in exchanges.items()}
+                fetched = {name: len(exchange.orders) for name, exchange in exchanges.items()}
+                await asyncio.gather(*[GetOrdersResults(app).run({'exchange': name, 'order_ids': order_ids})
+                                       for name, order_ids in batches.items() if order_ids])
+
+        await app['order_tracker'].flush()
+        await app['outbox'].flush()
+
+    elapsed = time.perf_counter() - started
+    orders = sum(len(exchange.orders) for exchange in exchanges.values())
+    failed = sum(value for (name, _), value in metrics.counters.items() if name == 'balancing_order_errors_total')
+    p50, p90, p99 = np.percentile(latencies * 1e3, [50, 90, 99])
+
+    print(f'{cycles} cycles, {venues} venues, {latency * 1e3:g} ms median call latency: {elapsed:.2f} s')
+    print(f'cycle latency: p50 {p50:.2f} ms, p90 {p90:.2f} ms, p99 {p99:.2f} ms, max {latencies.max() * 1e3:.2f} ms')
+    print(f'orders: {orders} placed, {failed:g} failed, {orders / elapsed:.1f} orders/sec')
+    print(f'hedge residual: mean {residuals.mean():.2f} USD, max {residuals.max():.2f} USD, '
+          f'{int((residuals > Config.MIN_DISBALANCE).sum())} cycles above MIN_DISBALANCE')
+    polls = sum(histogram.count for (name, labels), histogram in metrics.histograms.items()
+                if name == 'exchange_call_seconds' and dict(labels)['method'] == 'get_order_by_id')
+    print(f'order results published: {len(broker.queues[RabbitMqQueues.UPDATE_ORDERS])}, '
+          f'get_order_by_id calls: {polls}, messages published: {broker.published}')
+
+    reprices = sum(value for (name, _), value in metrics.counters.items() if name == 'balancing_reprices_total')
+    print(f'reprices: {reprices:g}')
+
+    for (name, labels), histogram in sorted(metrics.histograms.items()):
+        if name == 'balancing_time_to_flat_seconds':
+            print(f'time to flat: {histogram.count} hedges, p50 {histogram.quantile(0.5) * 1e3:.3f} ms, '
+                  f'p99 {histogram.quantile(0.99) * 1e3:.3f} ms')
+
+        if name == 'order_fill_seconds':
+            labels = dict(labels)
+            print(f'  {labels["exchange"]:>8} {labels["status"]:>22}: {histogram.count:6} orders, '
+                  f'p50 {histogram.quantile(0.5) * 1e3:.3f} ms, p99 {histogram.quantile(0.99) * 1e3:.3f} ms')
+
+    for (name, labels), histogram in sorted(metrics.histograms.items()):
+        if name == 'balancing_phase_seconds':
+            print(f'  {dict(labels)["phase"]:>9}: p50 {histogram.quantile(0.5) * 1e3:.3f} ms, '
+                  f'p99 {histogram.quantile(0.99) * 1e3:.3f} ms')
+
+    app['order_tracker'].stop()
+    await app['outbox'].stop()
+    await app['sessions'].close()
+    app['clients'].close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cycles', type=int, default=2000)
+    parser.add_argument('--venues', type=int, default=3, help=f'up to {len(VENUES)}, BINANCE is always included')
+    parser.add_argument('--latency', type=float, default=0.002, help='median seconds per exchange call')
+    parser.add_argument('--disbalance', type=float, default=5000, help='max USD of the external fill per cycle')
+    parser.add_argument('--volatility', type=float, default=0.0005, help='price log-return sigma per cycle')
+    parser.add_argument('--fill-ratio', type=float, default=1.0, dest='fill_ratio')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, dest='disconnect_rate')
+    parser.add_argument('--rest', action='store_true', help='keep unfilled orders open instead of cancelling them')
+    parser.add_argument('--results-every', type=int, default=0, dest='results_every')
+    parser.add_argument('--execution', choices=['single', 'adaptive'], default=Config.EXECUTION['mode'])
+    parser.add_argument('--reprice-interval', type=float, default=0.05, dest='reprice_interval')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.cycles, args.venues, args.latency, args.disbalance, args.volatility, args.fill_ratio,
+                     args.disconnect_rate, args.rest, args.results_every, args.execution, args.reprice_interval,
+                     args.seed))
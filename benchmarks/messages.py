@@ -0,0 +1,90 @@
+"""
+Bytes per record and encode/decode throughput of core.messages formats for ORDERS records:
+
+    python -m benchmarks.messages --records 100000 --batch 100
+
+Encoding includes building the records, as balancing does per message. The baseline is the dict
+literal of the balancing task before records, the default path (record JSON, one message per record
+as Publisher.publish sends it) has to match it.
+"""
+import argparse
+import datetime
+import time
+import uuid
+
+import orjson
+
+from core.messages import JSON, MSGPACK, OrderRecord, decode, encode
+
+
+PARENT_ID = uuid.uuid4()
+
+
+def make_dict(i: int) -> dict:
+    """
+    ORDERS message as the balancing task built it before records
+    """
+    return {
+        'id': uuid.uuid4(), 'datetime': datetime.datetime.utcnow(), 'ts': time.time(), 'context': 'balancing',
+        'parent_id': PARENT_ID, 'exchange_order_id': f'order-{i}', 'type': 'GTC', 'status': 'Processing',
+        'exchange': 'BINANCE', 'side': 'buy', 'symbol': 'BTCUSDT', 'expect_price': 30000.5 + i,
+        'expect_amount_coin': 0.01, 'expect_amount_usd': 300.005, 'expect_fee': 0.15, 'factual_price': 0,
+        'factual_amount_coin': 0, 'factual_amount_usd': 0, 'factual_fee': 0.0005, 'order_place_time': 0.05,
+        'env': 'prod'
+    }
+
+
+def make_record(i: int) -> OrderRecord:
+    record: OrderRecord = {
+        'id': uuid.uuid4(), 'datetime': datetime.datetime.utcnow(), 'ts': time.time(), 'context': 'balancing',
+        'parent_id': PARENT_ID, 'exchange_order_id': f'order-{i}', 'type': 'GTC', 'status': 'Processing',
+        'exchange': 'BINANCE', 'side': 'buy', 'symbol': 'BTCUSDT', 'expect_price': 30000.5 + i,
+        'expect_amount_coin': 0.01, 'expect_amount_usd': 300.005, 'expect_fee': 0.15, 'factual_price': 0,
+        'factual_amount_coin': 0, 'factual_amount_usd': 0, 'factual_fee': 0.0005, 'order_place_time': 0.05,
+        'env': 'prod'
+    }
+
+    return record
+
+
+def measure(name: str, count: int, batch: int, repeat: int, factory, encoder, decoder) -> float:
+    """
+    :return: encoded records per second, the best of `repeat` runs
+    """
+    encoded = decoded_in = float('inf')
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        messages = [message for i in range(0, count, batch)
+                    for message in encoder([factory(j) for j in range(i, min(i + batch, count))])]
+        encoded = min(encoded, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        decoded = sum(len(decoder(message)) for message in messages)
+        decoded_in = min(decoded_in, time.perf_counter() - started)
+
+    size = sum(len(body) for body, *_ in messages)
+    print(f'{name:>22}: {size / count:6.1f} bytes/record, {len(messages):6} messages, '
+          f'encode {count / encoded / 1e3:7.1f}k rec/s, decode {decoded / decoded_in / 1e3:7.1f}k rec/s')
+
+    return count / encoded
+
+
+def main(count: int, batch: int, repeat: int) -> None:
+    baseline = measure('dict + orjson', count, 1, repeat, make_dict, lambda chunk: [(orjson.dumps(chunk[0]),)],
+                       lambda message: [orjson.loads(message[0])])
+    default = measure('record JSON', count, 1, repeat, make_record, lambda chunk: [(orjson.dumps(chunk[0]),)],
+                      lambda message: decode(message[0], JSON))
+    measure(f'record msgpack x{batch}', count, batch, repeat, make_record, lambda chunk: encode(chunk, MSGPACK),
+            lambda message: decode(message[0], MSGPACK, message[1]))
+    print(f'record JSON encodes at {default / baseline:.0%} of the baseline')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=100, help='records per msgpack message')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per format, the best one is reported')
+    args = parser.parse_args()
+
+    main(args.records, args.batch, args.repeat)
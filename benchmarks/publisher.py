@@ -0,0 +1,63 @@
+"""
+Publishing throughput against a live RabbitMQ from Config.RABBIT.
+
+Compares the legacy channel-per-message path with core.publisher.Publisher:
+
+    python -m benchmarks.publisher -n 2000
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import orjson
+from aio_pika import ExchangeType, Message, connect_robust
+
+from config import Config
+from core.publisher import Publisher
+
+ROUTING_KEY = 'logger.event.benchmark_publisher'
+
+
+async def publish_per_channel(connection, message, routing_key, exchange_name, queue_name):
+    channel = await connection.channel()
+    exchange = await channel.declare_exchange(exchange_name, type=ExchangeType.DIRECT, durable=True)
+    queue = await channel.declare_queue(queue_name, durable=True)
+    await queue.bind(exchange, routing_key=routing_key)
+    await exchange.publish(Message(orjson.dumps(message)), routing_key=routing_key)
+    await channel.close()
+
+
+async def measure(publish, count: int) -> float:
+    started = time.perf_counter()
+
+    for _ in range(count):
+        await publish({'id': uuid.uuid4(), 'ts': time.time()}, ROUTING_KEY, 'logger.event', ROUTING_KEY)
+
+    return count / (time.perf_counter() - started)
+
+
+async def main(count: int) -> None:
+    connection = await connect_robust(
+        f"amqp://{Config.RABBIT['username']}:{Config.RABBIT['password']}@{Config.RABBIT['host']}:"
+        f"{Config.RABBIT['port']}/"
+    )
+    publisher = Publisher(connection)
+
+    before = await measure(lambda *args: publish_per_channel(connection, *args), count)
+    after = await measure(publisher.publish, count)
+    print(f'channel per message: {before:.0f} msg/s')
+    print(f'cached publisher:    {after:.0f} msg/s ({after / before:.1f}x)')
+
+    channel = await connection.channel()
+    await channel.queue_delete(ROUTING_KEY)
+    await publisher.close()
+    await connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=1000, dest='count')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.count))
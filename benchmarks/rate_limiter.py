@@ -0,0 +1,247 @@
+"""
+RateLimiter against a rate limited SimulatedExchange on a simulated clock, minutes of traffic run in seconds:
+
+    python -m benchmarks.rate_limiter --seconds 600 --rate 20 --burst 40
+
+The exchange accepts --rate calls per second with bursts of --burst and rejects the rest with a 429.
+Cancels, orders and queries arrive as Poisson processes at about 10, 20 and 40% of --rate, telemetry
+callers are always backlogged and take the rest, so the exchange is saturated. Every scenario reports
+accepted calls per second against the most the exchange allows in the time, 429s and the wait per
+priority class:
+
+    no limiter       callers retry 429s after --retry seconds
+    limiter          buckets equal to the exchange limits
+    limiter 2x       buckets twice the exchange limits, corrected by rate headers and Retry-After
+    limiter 2x blind the same without rate headers, corrected by 429s only
+
+The run fails if a limiter scenario with correct limits or rate headers (limiter, limiter 2x) gets any
+429, less than --min-throughput of the allowed calls or a median wait of a class above the one of a
+lower class. The default 99% needs the default --seconds, shorter runs lose a larger share to the ramp
+up. Before the scenarios, requests of all classes queued behind a Retry-After pause and behind a 429
+without one must be released cancels first, then orders, queries and telemetry, FIFO within a class.
+Rejection warnings of the limiter are muted.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import selectors
+import sys
+
+from core.client_pool import ClientPool
+from core.enums import RequestPriority
+from core.metrics import Metrics
+from core.rate_limiter import RateLimiter
+from tools.simulator import RateLimitExceeded, SimulatedExchange
+
+PRIORITIES = {
+    RequestPriority.CANCEL: 'cancel',
+    RequestPriority.ORDER: 'order',
+    RequestPriority.QUERY: 'query',
+    RequestPriority.TELEMETRY: 'telemetry'
+}
+
+
+class VirtualClock(selectors.SelectSelector):
+    """
+    Selector moving simulated time forward instead of blocking, timers and sleeps of the event loop then
+    fire at once and in order, the loop only ever waits for its own timers
+    """
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError('Nothing is scheduled, the simulation cannot advance')
+
+        self.now += timeout
+
+        return []
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self.clock = VirtualClock()
+        super().__init__(self.clock)
+
+    def time(self) -> float:
+        return self.clock.now
+
+
+async def caller(pool: ClientPool, exchange: SimulatedExchange, priority: int, deadline: float, interval: float,
+                 retry: float, counts: dict, rng: random.Random) -> None:
+    """
+    :param interval: mean seconds between calls, arrivals are Poisson so no class keeps a fixed phase against
+                     the others, 0 to call again as soon as the previous call returns
+    """
+    loop = asyncio.get_event_loop()
+    methods = {
+        RequestPriority.CANCEL: lambda: pool.call(exchange.cancel_all_orders),
+        RequestPriority.ORDER: lambda: pool.call(exchange.create_order, amount=0.001, price=exchange.price,
+                                                 side='buy'),
+        RequestPriority.QUERY: lambda: pool.call(exchange.get_positions),
+        RequestPriority.TELEMETRY: lambda: pool.call(exchange.get_order_by_id, [], None,
+                                                     priority=RequestPriority.TELEMETRY)
+    }
+
+    while loop.time() < deadline:
+        if interval:
+            await asyncio.sleep(rng.expovariate(1 / interval))
+
+        try:
+            await methods[priority]()
+            counts[priority] += 1
+
+        except RateLimitExceeded:
+            await asyncio.sleep(retry)
+
+
+async def scenario(name: str, seconds: float, rate: float, burst: float, limits: dict, headers: bool,
+                   latency: float, retry: float) -> tuple:
+    """
+    :return: accepted share of the allowed calls, number of 429s, priority -> median wait in seconds
+    """
+    loop = asyncio.get_event_loop()
+    metrics = Metrics()
+    exchange = SimulatedExchange('BINANCE', latency=latency, jitter=0.5, rate_limit=rate, rate_burst=burst, seed=0)
+    pool = ClientPool({'BINANCE': exchange}, metrics=metrics, limiter=RateLimiter(limits, metrics=metrics))
+
+    if not headers:
+        exchange.listeners.clear()
+
+    counts = dict.fromkeys(PRIORITIES, 0)
+    deadline = loop.time() + seconds
+    callers = [
+        *[(RequestPriority.CANCEL, 2 / (rate * 0.1)) for _ in range(2)],
+        *[(RequestPriority.ORDER, 2 / (rate * 0.2)) for _ in range(2)],
+        *[(RequestPriority.QUERY, 8 / (rate * 0.4)) for _ in range(8)],
+        *[(RequestPriority.TELEMETRY, 0) for _ in range(4)]
+    ]
+    rng = random.Random(0)
+    await asyncio.gather(*[caller(pool, exchange, priority, deadline, interval, retry, counts, rng)
+                           for priority, interval in callers])
+
+    accepted = sum(counts.values())
+    allowed = rate + burst / seconds
+    print(f'{name:>16}: {accepted / seconds:6.2f} calls/s of {allowed:.2f} allowed '
+          f'({accepted / seconds / allowed:6.1%}), {exchange.rejected:6} 429s')
+
+    medians = dict.fromkeys(PRIORITIES, 0.0)
+
+    for priority, label in PRIORITIES.items():
+        waits = metrics.histograms.get(('rate_limit_wait_seconds', (('exchange', 'BINANCE'),
+                                                                    ('priority', str(priority)))))
+        wait = f'wait p50 {waits.quantile(0.5) * 1e3:8.1f} ms, p99 {waits.quantile(0.99) * 1e3:8.1f} ms' \
+            if waits is not None else 'not limited'
+        print(f'{label:>26}: {counts[priority] / seconds:6.2f} calls/s, {wait}')
+
+        if waits is not None:
+            medians[priority] = waits.quantile(0.5)
+
+    return accepted / seconds / allowed, exchange.rejected, medians
+
+
+async def release_order(rejected: bool) -> list:
+    """
+    Queue requests of all classes, lowest class first, while the exchange is paused by a Retry-After or,
+    with `rejected`, by a 429 without one, and record the order the limiter lets them pass
+
+    :return: (priority, arrival) of the requests in release order
+    """
+    limiter = RateLimiter({'BINANCE': {'rate': 10, 'burst': 1}}, pause=1)
+    released = []
+
+    async def request(priority: int, arrival: int) -> None:
+        await limiter.acquire('BINANCE', 'get_positions', priority)
+        released.append((priority, arrival))
+        limiter.release('BINANCE')
+
+    await limiter.acquire('BINANCE', 'get_positions')
+    limiter.release('BINANCE')
+    limiter.update('BINANCE', None if rejected else {'Retry-After': '1'}, 'get_positions', rejected=rejected)
+
+    requests = []
+
+    for arrival in range(3):
+        for priority in sorted(PRIORITIES, reverse=True):
+            requests.append(asyncio.ensure_future(request(priority, arrival)))
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*requests)
+
+    return released
+
+
+def check_release_order() -> list:
+    """
+    :return: failures of the release order checks
+    """
+    failed = []
+
+    for name, rejected in (('Retry-After', False), ('429', True)):
+        loop = VirtualTimeLoop()
+
+        try:
+            released = loop.run_until_complete(release_order(rejected))
+        finally:
+            loop.close()
+
+        if released != sorted(released):
+            failed.append(f'release order after {name}: {[PRIORITIES[priority] for priority, _ in released]}')
+
+    return failed
+
+
+def main(seconds: float, rate: float, burst: float, latency: float, retry: float, min_throughput: float) -> bool:
+    """
+    :return: True if requests were released by class and the checked scenarios had no 429s, at least
+             min_throughput of the allowed calls and median waits in class order
+    """
+    scenarios = [
+        ('no limiter', {}, True, False),
+        ('limiter', {'BINANCE': {'rate': rate, 'burst': burst}}, True, True),
+        ('limiter 2x', {'BINANCE': {'rate': rate * 2, 'burst': burst * 2}}, True, True),
+        ('limiter 2x blind', {'BINANCE': {'rate': rate * 2, 'burst': burst * 2}}, False, False)
+    ]
+    failed = check_release_order()
+
+    for name, limits, headers, checked in scenarios:
+        loop = VirtualTimeLoop()
+
+        try:
+            throughput, rejected, waits = loop.run_until_complete(scenario(name, seconds, rate, burst, limits,
+                                                                           headers, latency, retry))
+        finally:
+            loop.close()
+
+        if checked and (rejected or throughput < min_throughput):
+            failed.append(f'{name}: {rejected} 429s, {throughput:.1%} of allowed calls, expected 0 429s and '
+                          f'at least {min_throughput:.0%}')
+
+        inverted = [f'{PRIORITIES[higher]} {waits[higher] * 1e3:.1f} ms > {PRIORITIES[lower]} '
+                    f'{waits[lower] * 1e3:.1f} ms'
+                    for higher, lower in zip(PRIORITIES, list(PRIORITIES)[1:]) if waits[higher] > waits[lower]]
+
+        if checked and inverted:
+            failed.append(f'{name}: median wait of a class above the next lower one: {", ".join(inverted)}')
+
+    for failure in failed:
+        print(f'FAILED {failure}')
+
+    return not failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=600, help='simulated seconds per scenario')
+    parser.add_argument('--rate', type=float, default=20, help='calls per second the exchange accepts')
+    parser.add_argument('--burst', type=float, default=40, help='calls the exchange accepts at once')
+    parser.add_argument('--latency', type=float, default=0.05, help='median seconds per call')
+    parser.add_argument('--retry', type=float, default=0.1, help='seconds callers wait after a 429')
+    parser.add_argument('--min-throughput', type=float, default=0.99, dest='min_throughput',
+                        help='share of the allowed calls the checked scenarios must reach')
+    args = parser.parse_args()
+    logging.getLogger('core.rate_limiter').setLevel(logging.ERROR)
+
+    sys.exit(0 if main(args.seconds, args.rate, args.burst, args.latency, args.retry, args.min_throughput) else 1)
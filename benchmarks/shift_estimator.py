@@ -0,0 +1,41 @@
+"""
+Per-tick update cost of core.shift_estimator.ShiftEstimator:
+
+    python -m benchmarks.shift_estimator --exchanges 6
+"""
+import argparse
+import time
+
+import numpy as np
+
+from core.shift_estimator import ShiftEstimator
+
+
+def main(exchanges: int, ticks: int) -> None:
+    rng = np.random.default_rng(0)
+    names = [f'EXCHANGE_{i}' for i in range(exchanges)]
+    prices = 30000 * (1 + rng.normal(0, 0.0005, (ticks, exchanges)))
+    estimator = ShiftEstimator(names, {'halflife': 480, 'min_ticks': 20})
+    timings = np.empty(ticks)
+
+    for i in range(ticks):
+        tick = dict(zip(names, prices[i]))
+        started = time.perf_counter()
+        estimator.update(tick)
+        timings[i] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    estimator.current({})
+    read = time.perf_counter() - started
+
+    p50, p99 = np.percentile(timings * 1e6, [50, 99])
+    print(f'{exchanges} exchanges: update p50 {p50:.1f} us, p99 {p99:.1f} us, read shifts {read * 1e6:.1f} us')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--exchanges', type=int, default=6)
+    parser.add_argument('--ticks', type=int, default=100000)
+    args = parser.parse_args()
+
+    main(args.exchanges, args.ticks)
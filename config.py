@@ -1,5 +1,6 @@
 from os import getenv
 
+import orjson
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,16 +12,46 @@ HOUR = MINUTE * 60
 DAY = HOUR * 24
 
 GLOBAL_SYMBOL = getenv('GLOBAL_SYMBOL')
+BALANCING_SYMBOLS = [symbol.strip() for symbol in (getenv('BALANCING_SYMBOLS') or GLOBAL_SYMBOL or '').split(',')
+                     if symbol.strip()]
+
+
+def exchange_symbol(env_prefix: str, coin: str) -> str:
+    """
+    Exchange ticker of coin: {PREFIX}_SYMBOL_{COIN}, {PREFIX}_SYMBOL for GLOBAL_SYMBOL
+    """
+    return getenv(f'{env_prefix}_SYMBOL_{coin}') or (getenv(f'{env_prefix}_SYMBOL') if coin == GLOBAL_SYMBOL else None)
 
 
 class Config:
     MIN_DISBALANCE = float(getenv('MIN_DISBALANCE'))
     LEVERAGE = float(getenv('LEVERAGE'))
     TIMEOUT = float(getenv('TIMEOUT', 180))
+    CLIENTS_READY_TIMEOUT = float(getenv('CLIENTS_READY_TIMEOUT', 15))
+    CLIENTS_READY_POLL = float(getenv('CLIENTS_READY_POLL', 0.1))
+    # threads per exchange running blocking calls of legacy sync clients, see core/client_adapter.py
+    CLIENT_EXECUTOR_WORKERS = int(getenv('CLIENT_EXECUTOR_WORKERS', 4))
+    CLIENT_CALL_TIMEOUT = float(getenv('CLIENT_CALL_TIMEOUT', 10))
+    SNAPSHOT_TIMEOUT = float(getenv('SNAPSHOT_TIMEOUT', 5))
+    BOOK_DEPTH = int(getenv('BOOK_DEPTH', 10))
+    MAX_BOOK_AGE = float(getenv('MAX_BOOK_AGE', 5))
     ENV = getenv('ENV')
     TELEGRAM_CHAT_ID = getenv('TELEGRAM_CHAT_ID')
     TELEGRAM_TOKEN = getenv('TELEGRAM_TOKEN')
     GLOBAL_SYMBOL = getenv("GLOBAL_SYMBOL")
+    BALANCING_SYMBOLS = BALANCING_SYMBOLS
+
+    # coin -> exchange -> exchange ticker
+    SYMBOLS = {
+        coin: {
+            'BITMEX': exchange_symbol('BITMEX', coin),
+            'DYDX': exchange_symbol('DYDX', coin),
+            'BINANCE': exchange_symbol('BINANCE', coin),
+            'OKX': exchange_symbol('OKEX', coin),
+            'KRAKEN': exchange_symbol('KRAKEN', coin),
+            'APOLLOX': exchange_symbol('APOLLOX', coin)
+        } for coin in BALANCING_SYMBOLS
+    }
 
     RABBIT = {
         "host": getenv("RABBIT_HOST"),
@@ -29,6 +60,103 @@ class Config:
         "password": getenv("RABBIT_PASSWORD")
     }
 
+    HTTP = {
+        "limit": int(getenv("HTTP_LIMIT", 100)),
+        "limit_per_host": int(getenv("HTTP_LIMIT_PER_HOST", 20)),
+        "keepalive_timeout": float(getenv("HTTP_KEEPALIVE_TIMEOUT", 60)),
+        "ttl_dns_cache": int(getenv("HTTP_DNS_CACHE_TTL", 300)),
+        "total_timeout": float(getenv("HTTP_TOTAL_TIMEOUT", 10)),
+        "connect_timeout": float(getenv("HTTP_CONNECT_TIMEOUT", 3)),
+        "sock_read_timeout": float(getenv("HTTP_SOCK_READ_TIMEOUT", 5))
+    }
+    # per-exchange overrides of HTTP, e.g. {"DYDX": {"limit_per_host": 40, "total_timeout": 5}}
+    HTTP_EXCHANGES = orjson.loads(getenv("HTTP_EXCHANGES", "{}"))
+
+    # token buckets of exchange calls, see core/rate_limiter.py: rate is request weight per second, burst the
+    # bucket size, endpoints are extra buckets by client method and weights the cost of a method (1 by default).
+    # burst + rate * window stays within the exchange's fixed window limits, exchanges without an entry are
+    # not limited, overrides by exchange e.g. RATE_LIMITS={"OKX": {"rate": 20, "burst": 40}}
+    RATE_LIMITS = {
+        "BINANCE": {
+            "rate": 36, "burst": 240,
+            "weights": {"get_positions": 5, "get_real_balance": 5, "get_available_balance": 5},
+            "endpoints": {"create_order": {"rate": 18, "burst": 100}}
+        },
+        "DYDX": {"rate": 15, "burst": 25},
+        **orjson.loads(getenv("RATE_LIMITS", "{}"))
+    }
+    # pause after a 429 without Retry-After header, seconds
+    RATE_LIMIT_PAUSE = float(getenv("RATE_LIMIT_PAUSE", 1))
+
+    OUTBOX = {
+        "max_size": int(getenv("OUTBOX_MAX_SIZE", 10000)),
+        "batch_size": int(getenv("OUTBOX_BATCH_SIZE", 100)),
+        "flush_interval": float(getenv("OUTBOX_FLUSH_INTERVAL", 0.05)),
+        "retries": int(getenv("OUTBOX_RETRIES", 3)),
+        "shutdown_timeout": float(getenv("OUTBOX_SHUTDOWN_TIMEOUT", 10))
+    }
+
+    STREAM_TRIGGER = {
+        "debounce": float(getenv("TRIGGER_DEBOUNCE", 1)),
+        "min_interval": float(getenv("TRIGGER_MIN_INTERVAL", 15))
+    }
+
+    # consumer settings by queue name prefix, the longest matching prefix wins, ack is 'early' (before the task)
+    # or 'late' (after it), e.g. CONSUMER_QUEUES={"logger.event": {"prefetch": 200, "max_in_flight": 200}}
+    # periodic messages arriving during a cycle return at once after being merged into its follow-up run
+    CONSUMER_QUEUES = {
+        'logger.periodic': {'prefetch': 2, 'max_in_flight': 2, 'ack': 'early'},
+        'logger.event': {'prefetch': 100, 'max_in_flight': 100, 'ack': 'late'}
+    }
+    CONSUMER_QUEUES_OVERRIDES = orjson.loads(getenv("CONSUMER_QUEUES", "{}"))
+    # processes for CPU-heavy task steps, 0 runs them inline on the event loop
+    WORKER_PROCESSES = int(getenv("WORKER_PROCESSES", 0))
+
+    # Prometheus endpoint served by the consumer at http://host:port/metrics, port 0 disables it
+    METRICS = {
+        "host": getenv("METRICS_HOST", "0.0.0.0"),
+        "port": int(getenv("METRICS_PORT", 9108)),
+        "loop_lag_interval": float(getenv("METRICS_LOOP_LAG_INTERVAL", 0.5))
+    }
+
+    # record encoding per routing key, application/json (default, one record per message as before) or
+    # application/x-msgpack (outbox batches records in one message, see core/messages.py),
+    # e.g. MESSAGE_FORMATS={"logger.event.insert_orders": "application/x-msgpack"}
+    MESSAGE_FORMATS = orjson.loads(getenv("MESSAGE_FORMATS", "{}"))
+
+    # order ids arriving within window seconds are fetched together, see core/order_fetcher.py
+    ORDER_RESULTS = {
+        "window": float(getenv("ORDER_RESULTS_WINDOW", 0.05)),
+        "chunk_size": int(getenv("ORDER_RESULTS_CHUNK_SIZE", 20)),
+        "max_concurrent": int(getenv("ORDER_RESULTS_MAX_CONCURRENT", 5)),
+        "retries": int(getenv("ORDER_RESULTS_RETRIES", 3)),
+        "backoff": float(getenv("ORDER_RESULTS_BACKOFF", 0.2)),
+        "max_backoff": float(getenv("ORDER_RESULTS_MAX_BACKOFF", 2))
+    }
+
+    # orders placed by balancing are polled every first_poll seconds, the interval grows by backoff up to
+    # max_poll while nothing fills, orders open after timeout are published with their filled amount
+    ORDER_TRACKER = {
+        "first_poll": float(getenv("ORDER_TRACKER_FIRST_POLL", 0.2)),
+        "max_poll": float(getenv("ORDER_TRACKER_MAX_POLL", 5)),
+        "backoff": float(getenv("ORDER_TRACKER_BACKOFF", 2)),
+        "timeout": float(getenv("ORDER_TRACKER_TIMEOUT", TIMEOUT)),
+        "chunk_size": int(getenv("ORDER_RESULTS_CHUNK_SIZE", 20))
+    }
+
+    # 'single' places one limit order per venue and leaves the unfilled part to the next cycle, 'adaptive'
+    # cancels and re-quotes it on the cached books every reprice_interval seconds, limits cross max_slippage
+    # deeper once aggressive_after of the budget is spent, until the residual is below MIN_DISBALANCE. The
+    # budget stays below TIMEOUT, the lease of the whole balancing cycle
+    EXECUTION = {
+        "mode": getenv("EXECUTION_MODE", "single"),
+        "budget": float(getenv("EXECUTION_BUDGET", TIMEOUT / 2)),
+        "reprice_interval": float(getenv("EXECUTION_REPRICE_INTERVAL", 1)),
+        "aggressive_after": float(getenv("EXECUTION_AGGRESSIVE_AFTER", 0.5)),
+        "max_slippage": float(getenv("EXECUTION_MAX_SLIPPAGE", 0.001)),
+        "cancel_timeout": float(getenv("EXECUTION_CANCEL_TIMEOUT", 2))
+    }
+
     BITMEX = {
         "api_key": getenv("BITMEX_API_KEY"),
         "api_secret": getenv("BITMEX_API_SECRET"),
@@ -79,16 +207,37 @@ class Config:
         "apollox_shift": int(getenv("APOLLOX_SHIFT"))
     }
 
+    # relative price deviation of each exchange, allocation values its book at price / (1 + shift). Not the
+    # legacy integer *_SHIFT settings above. tools/shifts.py prints pairwise 'A B' deviations, the shift of A
+    # is the mean of its 'A B' values over the other exchanges as core/shift_estimator.py computes it
+    SHIFTS = {
+        'BITMEX': float(getenv("BITMEX_PRICE_SHIFT", 0)),
+        'DYDX': float(getenv("DYDX_PRICE_SHIFT", 0)),
+        'BINANCE': float(getenv("BINANCE_PRICE_SHIFT", 0)),
+        'OKX': float(getenv("OKEX_PRICE_SHIFT", 0)),
+        'KRAKEN': float(getenv("KRAKEN_PRICE_SHIFT", 0)),
+        'APOLLOX': float(getenv("APOLLOX_PRICE_SHIFT", 0))
+    }
+
+    # online estimate replacing SHIFTS once an exchange has min_ticks samples, halflife is in ticks
+    SHIFT_ESTIMATOR = {
+        'halflife': float(getenv("SHIFT_HALFLIFE", 480)),
+        'min_ticks': int(getenv("SHIFT_MIN_TICKS", 20))
+    }
+
+    # interval and jitter are seconds, fractions allowed, jitter spreads symbols sharing one interval
     PERIODIC_TASKS = [
         {
-            'exchange': f'logger.periodic_{GLOBAL_SYMBOL}',
-            'queue': f'logger.periodic_{GLOBAL_SYMBOL}.balancing',
-            'routing_key': f'logger.periodic_{GLOBAL_SYMBOL}.balancing',
-            'interval': MINUTE * 3,
+            'exchange': f'logger.periodic_{symbol}',
+            'queue': f'logger.periodic_{symbol}.balancing',
+            'routing_key': f'logger.periodic_{symbol}.balancing',
+            'interval': float(getenv('BALANCING_INTERVAL', MINUTE * 3)),
             'delay': SECOND * 10,
+            'jitter': float(getenv('BALANCING_JITTER', 0)),
             'payload': {}
-        }
+        } for symbol in BALANCING_SYMBOLS
     ]
+    PRODUCER_STATS_INTERVAL = float(getenv('PRODUCER_STATS_INTERVAL', MINUTE))
 
     LOGGING = {
         'version': 1,
@@ -1,25 +1,43 @@
 import argparse
 import asyncio
+import functools
 import logging
+import multiprocessing
+import signal
 import traceback
+from concurrent.futures import ProcessPoolExecutor
 from logging.config import dictConfig
 
 import asyncpg
-import orjson
 from aio_pika import connect_robust
-from aiohttp.web import Application
+from aiohttp.web import Application, AppRunner, TCPSite
 
 from config import Config
+from core.client_pool import ClientPool
+from core.cycle_guard import CycleGuard
+from core.exposure import ExposureEngine
+from core.messages import decode
+from core.metrics import Metrics
+from core.order_fetcher import OrderResultsFetcher
+from core.order_tracker import OrderTracker
+from core.outbox import Outbox
+from core.publisher import LogPublisher, Publisher
+from core.queue_stats import QueueStats
+from core.scheduler import Scheduler
+from core.rebalance_trigger import RebalanceTrigger
+from core.session_pool import SessionPool
 from tasks.event.get_orders_results import GetOrdersResults
 from tasks.periodic.balancing import Balancing
 
 dictConfig(Config.LOGGING)
 logger = logging.getLogger(__name__)
 
+BALANCING_TASKS = {symbol: f'logger.periodic_{symbol}.balancing' for symbol in Config.BALANCING_SYMBOLS}
+
 TASKS = {
     'logger.event.get_orders_results': GetOrdersResults,
 
-    f'logger.periodic_{Config.GLOBAL_SYMBOL}.balancing': Balancing
+    **{routing_key: functools.partial(Balancing, symbol=symbol) for symbol, routing_key in BALANCING_TASKS.items()}
 }
 
 
@@ -28,69 +46,298 @@ class Consumer:
     Producer get periodic and events tasks from RabbitMQ
     """
 
-    def __init__(self, loop, queue=None):
+    def __init__(self, loop, queue=None, stream_trigger=False, local_scheduler=False, broker=True):
         self.app = Application()
+        self.app['metrics'] = Metrics()
+        self.runner = None
         self.loop = loop
         self.queue = queue
+        self.stream_trigger = stream_trigger
+        self.local_scheduler = local_scheduler or not broker
+        self.broker = broker
         self.rabbit_url = f"amqp://{Config.RABBIT['username']}:{Config.RABBIT['password']}@{Config.RABBIT['host']}:{Config.RABBIT['port']}/"  # noqa
         self.periodic_tasks = []
+        self.cycles = CycleGuard()
+        self.slots = {}
+        self.stats = {}
 
     async def run(self) -> None:
         """
         Init setup db connection and star tasks from queue
         :return: None
         """
-        await self.setup_mq()
+        if self.broker:
+            await self.setup_mq()
+        else:
+            self.setup_log_publisher()
 
         logger.info(f"Queue: {self.queue}")
         logger.info(f"Exist queue: {self.queue in TASKS}")
 
-        if self.queue and self.queue in TASKS:
-            logger.info("Single work option")
-            self.periodic_tasks.append(self.loop.create_task(self._consume(self.app['mq'], self.queue)))
+        if self.queue:
+            # a queue name or a prefix of names, e.g. logger.periodic for the balancing queues of all symbols
+            queues = [queue_name for queue_name in TASKS if queue_name.startswith(self.queue)]
+
+            if not queues:
+                logger.error(f"Unknown queue {self.queue}, queues: {list(TASKS)}")
+                raise RuntimeError(f'Unknown queue {self.queue}')
+
+            logger.info(f"Single work option: {queues}" if len(queues) == 1 else f"Multiple work option: {queues}")
 
         else:
             logger.info("Multiple work option")
-            for queue_name in TASKS:
-                self.periodic_tasks.append(self.loop.create_task(self._consume(self.app['mq'], queue_name)))
+            queues = list(TASKS)
+
+        if not self.broker and not any('logger.periodic' in queue_name for queue_name in queues):
+            raise RuntimeError(f'Nothing to run without RabbitMQ, no periodic queue in {queues}')
+
+        self.setup_clients(queues)
+
+        if self.local_scheduler:
+            self.setup_scheduler([queue_name for queue_name in queues if 'logger.periodic' in queue_name])
+
+        for queue_name in queues:
+            if not self.broker or (self.local_scheduler and 'logger.periodic' in queue_name):
+                continue
+
+            self.periodic_tasks.append(self.loop.create_task(self._consume(self.app['mq'], queue_name)))
+
+        if self.stream_trigger:
+            await self.setup_stream_triggers([symbol for symbol, routing_key in BALANCING_TASKS.items()
+                                              if routing_key in queues])
+
+        await self.setup_metrics()
 
     async def setup_mq(self):
         self.app['mq'] = await connect_robust(self.rabbit_url, loop=self.loop)
+        self.app['publisher'] = Publisher(self.app['mq'])
+        self.app['outbox'] = Outbox(self.app['publisher'])
+
+    def setup_log_publisher(self) -> None:
+        """
+        Run without RabbitMQ, telemetry and order results are logged instead of published
+        """
+        self.app['publisher'] = LogPublisher()
+        self.app['outbox'] = Outbox(self.app['publisher'])
+
+    def setup_scheduler(self, routing_keys) -> None:
+        """
+        Run periodic tasks from Config.PERIODIC_TASKS on a local scheduler instead of consuming the producer's messages
+        :param routing_keys: periodic routing keys run by this worker
+        :return: None
+        """
+        self.app['scheduler'] = Scheduler()
+
+        for task in Config.PERIODIC_TASKS:
+            if task['routing_key'] in routing_keys:
+                callback = functools.partial(self.execute, task['routing_key'], task.get('payload') or {})
+                self.app['scheduler'].add(task['routing_key'], task['interval'], callback,
+                                          delay=task['delay'], jitter=task.get('jitter', 0))
+
+        self.app['scheduler'].start()
+
+    def setup_clients(self, queues) -> None:
+        """
+        Build exchange clients once per process, periodic workers also warm them up immediately
+        :param queues: queue names consumed by this worker
+        :return: None
+        """
+        self.app['clients'] = ClientPool(metrics=self.app['metrics'])
+        self.app['sessions'] = SessionPool()
+        self.app['exposure'] = ExposureEngine(exchanges=list(self.app['clients'].clients),
+                                              symbols=Config.BALANCING_SYMBOLS)
+        self.app['shifts'] = {}
+        self.app['order_fetcher'] = OrderResultsFetcher(self.app['clients'], self.app['sessions'],
+                                                        self.app['publisher'])
+        self.app['order_tracker'] = OrderTracker(self.app['clients'], self.app['sessions'], self.app['outbox'],
+                                                 metrics=self.app['metrics'])
+
+        if Config.WORKER_PROCESSES:
+            # workers fork lazily on first submit, after the client updater threads are running, spawn them clean
+            self.app['workers'] = ProcessPoolExecutor(Config.WORKER_PROCESSES,
+                                                      mp_context=multiprocessing.get_context('spawn'))
+
+        if any('logger.periodic' in queue_name for queue_name in queues):
+            self.app['clients'].start()
+
+    async def setup_metrics(self) -> None:
+        """
+        Serve Prometheus metrics on the app, the app is frozen afterwards so every app key must be set before
+        :return: None
+        """
+        self.app['metrics'].start_loop_monitor(Config.METRICS['loop_lag_interval'])
+
+        if not Config.METRICS['port']:
+            return
+
+        self.app.router.add_get('/metrics', self.app['metrics'].handler)
+        self.runner = AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+
+        try:
+            await TCPSite(self.runner, Config.METRICS['host'], Config.METRICS['port']).start()
+            logger.info(f"Metrics on http://{Config.METRICS['host']}:{Config.METRICS['port']}/metrics")
+
+        except OSError as e:
+            logger.warning(f"Metrics endpoint is not served: {e}")
+
+    async def setup_stream_triggers(self, symbols) -> None:
+        """
+        Start balancing on account/order updates, the periodic queues stay as a safety sweep
+        :param symbols: coins balanced by this worker
+        :return: None
+        """
+        self.app['triggers'] = []
+
+        for symbol in symbols:
+            trigger = RebalanceTrigger(self.app['clients'], self.app['exposure'], symbol,
+                                       functools.partial(self.execute, BALANCING_TASKS[symbol], {'trigger': 'stream'}))
+            await trigger.start()
+            self.app['triggers'].append(trigger)
+
+    @staticmethod
+    def queue_settings(queue_name: str) -> dict:
+        """
+        Consumer settings of a queue, Config.CONSUMER_QUEUES merged from the shortest to the longest matching prefix
+        :param queue_name: queue name
+        :return: dict with prefetch, max_in_flight and ack
+        """
+        settings = {'prefetch': 1, 'max_in_flight': 1, 'ack': 'late'}
+
+        for source in (Config.CONSUMER_QUEUES, Config.CONSUMER_QUEUES_OVERRIDES):
+            for prefix in sorted(source, key=len):
+                if queue_name.startswith(prefix):
+                    settings.update(source[prefix])
+
+        return settings
 
     async def _consume(self, connection, queue_name) -> None:
+        settings = self.queue_settings(queue_name)
+        self.slots[queue_name] = asyncio.Semaphore(settings['max_in_flight'])
+        self.stats[queue_name] = QueueStats()
+        logger.info(f"Consume {queue_name} with {settings}")
+
         channel = await connection.channel()
+        await channel.set_qos(prefetch_count=settings['prefetch'])
 
         queue = await channel.declare_queue(queue_name, durable=True)
-        await queue.consume(self.on_message)
+        await queue.consume(functools.partial(self.on_message, queue_name, settings['ack']))
 
-    async def on_message(self, message) -> None:
+    async def on_message(self, queue_name: str, ack: str, message) -> None:
         logger.info(f"\n\nReceived message {message.routing_key}")
-        try:
-            if 'logger.periodic' in message.routing_key:
-                await message.ack()
+        stats = self.stats[queue_name]
+        received_at = stats.receive()
 
-            task = TASKS.get(message.routing_key)(self.app)
-            await task.run(orjson.loads(message.body))
-            logger.info(f"Success task {message.routing_key}")
-            if 'logger.event' in message.routing_key:
+        async with self.slots[queue_name]:
+            started_at = stats.begin(received_at)
+
+            try:
+                if ack == 'early':
+                    await message.ack()
+
+                for payload in decode(message.body, message.content_type, message.headers):
+                    await self.execute(message.routing_key, payload)
+                stats.end(started_at)
+
+            except Exception as e:
+                logger.info(f"Error {e} while serving task {message.routing_key}")
+                traceback.print_exc()
+                stats.end(started_at, failed=True)
+
+            if not message.processed:
                 await message.ack()
-        except Exception as e:
-            logger.info(f"Error {e} while serving task {message.routing_key}")
-            traceback.print_exc()
-            await message.ack()
+
+        logger.info(f"Queue stats {queue_name}: {stats.stats()}")
+
+    async def execute(self, routing_key: str, payload: dict) -> None:
+        """
+        Run task for routing key, periodic runs of the same key (one symbol) never overlap,
+        triggers arriving meanwhile are merged into one follow-up run
+        :param routing_key: key from TASKS
+        :param payload: task payload
+        :return: None
+        """
+        if 'logger.periodic' in routing_key:
+            if not await self.cycles.run(routing_key, lambda: TASKS[routing_key](self.app).run(payload)):
+                logger.info(f"Task {routing_key} is running, merged into its follow-up run")
+                return
+        else:
+            await TASKS[routing_key](self.app).run(payload)
+
+        logger.info(f"Success task {routing_key}")
+        logger.info(f"HTTP pool stats: {self.app['sessions'].stats()}")
+
+    async def stop(self) -> None:
+        """
+        Release long-lived resources before the loop is closed
+        :return: None
+        """
+        for task in self.periodic_tasks:
+            task.cancel()
+
+        if self.app.get('scheduler') is not None:
+            logger.info(f"Scheduler stats: {self.app['scheduler'].stats()}")
+            await self.app['scheduler'].stop()
+
+        for trigger in self.app.get('triggers', []):
+            trigger.stop()
+
+        if self.app.get('order_tracker') is not None:
+            self.app['order_tracker'].stop()
+
+        if self.app.get('sessions') is not None:
+            await self.app['sessions'].close()
+
+        if self.app.get('clients') is not None:
+            self.app['clients'].close()
+
+        if self.app.get('workers') is not None:
+            self.app['workers'].shutdown(wait=False)
+
+        if self.app.get('outbox') is not None:
+            await self.app['outbox'].stop()
+
+        if self.app.get('publisher') is not None:
+            await self.app['publisher'].close()
+
+        if self.app.get('mq') is not None:
+            await self.app['mq'].close()
+
+        self.app['metrics'].stop()
+
+        if self.runner is not None:
+            await self.runner.cleanup()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('-q', nargs='?', const=True, dest='queue', default='logger.event.get_orders_results')
+    parser.add_argument('-q', nargs='?', const=True, dest='queue',
+                        help='queue or queue name prefix to consume, logger.event.get_orders_results by default, '
+                             'all queues with --local-scheduler or --no-broker')
+    parser.add_argument('--stream-trigger', action='store_true', dest='stream_trigger',
+                        help='start balancing on position/fill updates, periodic task stays as safety sweep')
+    parser.add_argument('--local-scheduler', action='store_true', dest='local_scheduler',
+                        help='run periodic tasks on an in-process scheduler instead of the producer, '
+                             'event queues are still consumed from RabbitMQ')
+    parser.add_argument('--no-broker', action='store_false', dest='broker',
+                        help='run without RabbitMQ: local scheduler, no event queues, messages are only logged')
     args = parser.parse_args()
 
+    if args.queue is None and args.broker and not args.local_scheduler:
+        args.queue = 'logger.event.get_orders_results'
+
     loop = asyncio.get_event_loop()
 
-    worker = Consumer(loop, queue=args.queue.strip())
+    worker = Consumer(loop, queue=args.queue.strip() if isinstance(args.queue, str) else None,
+                      stream_trigger=args.stream_trigger, local_scheduler=args.local_scheduler, broker=args.broker)
     loop.run_until_complete(worker.run())
 
+    # docker stop sends SIGTERM, leave run_forever so the worker flushes its outbox and closes connections
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, loop.stop)
+
     try:
         loop.run_forever()
     finally:
+        loop.run_until_complete(worker.stop())
         loop.close()
@@ -0,0 +1,85 @@
+from typing import NamedTuple
+
+import numpy as np
+
+
+class Allocation(NamedTuple):
+    """
+    Hedge split: venue -> amount in coin and limit price, residual is the part no venue could take,
+    notional is the fee and shift adjusted value of the taken levels
+    """
+    amounts: dict
+    prices: dict
+    residual: float
+    notional: float
+
+
+def allocate(levels: dict, amount: float, side: str, fees: dict, shifts: dict = None,
+             capacities: dict = None) -> Allocation:
+    """
+    Cost-minimising split of a hedge across venues by walking their cached depth.
+
+    Every level is valued at its fee and shift adjusted price, levels of all venues are taken
+    cheapest first (best proceeds first for sells) until the amount is filled, capped by each
+    venue's capacity. For linear per-level costs this greedy walk is the optimal split.
+
+    :param levels: venue -> (N, 2) array of (price, size) of the side being hit, best first
+    :param amount: hedge amount in coin
+    :param side: 'buy' or 'sell'
+    :param fees: venue -> taker fee rate
+    :param shifts: venue -> relative price deviation of the venue, fair price = price / (1 + shift)
+    :param capacities: venue -> max amount in coin the venue can take (available margin)
+    :return: Allocation, venues without levels are skipped, with none left all of the amount is residual
+    """
+    venues = [venue for venue in levels if len(levels[venue])]
+
+    if not venues:
+        return Allocation(amounts={}, prices={}, residual=max(float(amount), 0.0), notional=0.0)
+
+    shifts = shifts or {}
+    capacities = capacities or {}
+    depth = max(len(levels[venue]) for venue in venues)
+
+    prices = np.full((len(venues), depth), np.nan)
+    sizes = np.zeros((len(venues), depth))
+
+    for i, venue in enumerate(venues):
+        prices[i, :len(levels[venue])] = levels[venue][:, 0]
+        sizes[i, :len(levels[venue])] = levels[venue][:, 1]
+
+    fee = np.array([fees.get(venue, 0) for venue in venues])[:, None]
+    shift = np.array([shifts.get(venue, 0) for venue in venues])[:, None]
+    capacity = np.array([capacities.get(venue, np.inf) for venue in venues])[:, None]
+
+    if side == 'buy':
+        key = prices * (1 + fee) / (1 + shift)
+    else:
+        key = -prices * (1 - fee) / (1 + shift)
+
+    cumulative = np.cumsum(sizes, axis=1)
+    sizes = np.clip(capacity - (cumulative - sizes), 0, sizes)
+    key[sizes <= 0] = np.inf
+    key[np.isnan(key)] = np.inf
+
+    order = np.argsort(key, axis=None, kind='stable')
+    ordered_sizes = sizes.ravel()[order]
+    taken_before = np.cumsum(ordered_sizes) - ordered_sizes
+    taken = np.zeros(sizes.size)
+    taken[order] = np.clip(amount - taken_before, 0, ordered_sizes)
+    taken = taken.reshape(sizes.shape)
+
+    venue_amounts = taken.sum(axis=1)
+    hit = taken > 0
+    worst = np.where(hit, prices, -np.inf if side == 'buy' else np.inf)
+    limit_prices = worst.max(axis=1) if side == 'buy' else worst.min(axis=1)
+    notional = float((np.abs(np.where(hit, key, 0)) * taken).sum())
+
+    amounts, limits = {}, {}
+
+    for i, venue in enumerate(venues):
+        if venue_amounts[i] > 0:
+            amounts[venue] = float(venue_amounts[i])
+            limits[venue] = float(limit_prices[i])
+
+    return Allocation(amounts=amounts, prices=limits, residual=max(amount - float(venue_amounts.sum()), 0.0),
+                      notional=notional)
@@ -3,13 +3,20 @@ from abc import ABC, abstractmethod
 
 
 class BaseClient(ABC):
+    """
+    Exchange client contract: every exchange call is a coroutine, only get_orderbook is sync as it reads
+    in-memory websocket state. Legacy clients with blocking methods are wrapped by core.client_adapter.
+
+    ClientPool builds one client per exchange with `symbols`, the tickers of all balanced coins, in its
+    config: orderbooks and positions are kept for all of them, calls acting on one symbol use `symbol`.
+    """
     BASE_URL = None
     BASE_WS = None
     EXCHANGE_NAME = None
     LAST_ORDER_ID = 'default'
 
     @abstractmethod
-    def get_available_balance(self, side: str) -> float:
+    async def get_available_balance(self, side: str) -> float:
         """
         Amount available to trade in certain direction in USD
 
@@ -28,15 +35,26 @@ class BaseClient(ABC):
         :param price: SELL/BUY price
         :param side: SELL/BUY in lowercase
         :param order_type: LIMIT or MARKET
-        :param session: session from aiohttpClientSession
+        :param session: shared per-exchange session from core.session_pool.SessionPool
         :param expire: int value for exp of order
         :param client_ID:
-        :return:
+        :return: dict with the exchange_order_id of the new order
         """
         pass
 
     @abstractmethod
-    def cancel_all_orders(self, orderID=None) -> dict:
+    async def get_order_by_id(self, order_ids, session: aiohttp.ClientSession) -> dict:
+        """
+        Get order results by exchange order id
+
+        :param order_ids: exchange order id(s)
+        :param session: shared per-exchange session from core.session_pool.SessionPool
+        :return: order result in UPDATE_ORDERS format
+        """
+        pass
+
+    @abstractmethod
+    async def cancel_all_orders(self, orderID=None) -> dict:
         """
         cancels all orders by symbol or orderID
         :return: response from exchange api
@@ -44,17 +62,44 @@ class BaseClient(ABC):
         pass
 
     @abstractmethod
-    def get_positions(self) -> dict:
+    async def get_positions(self) -> dict:
         pass
 
     @abstractmethod
-    def get_real_balance(self) -> float:
+    async def get_real_balance(self) -> float:
        pass
 
     @abstractmethod
     def get_orderbook(self) -> dict:
+        """
+        Orderbooks from websocket state, must not do I/O
+
+        :return: symbol -> {'asks': [[price, size], ...], 'bids': [...], 'timestamp': ...}
+        """
         pass
 
     @abstractmethod
-    def get_last_price(self, side: str) -> float:
+    async def get_last_price(self, side: str) -> float:
         pass
+
+    def add_listener(self, callback) -> None:
+        """
+        Subscribe to account/order updates of the client
+
+        :param callback: callback(event_type, payload), event_type is one of EventTypeEnum,
+                         ACCOUNT_UPDATE payload has get_positions() format, ORDER_TRADE_UPDATE payload has
+                         get_order_by_id() format with the order side and symbol (ticker), RATE_LIMIT payload
+                         is the headers of a REST response, may be called from updater thread
+        :return: None
+        """
+        if getattr(self, 'listeners', None) is None:
+            self.listeners = []
+
+        self.listeners.append(callback)
+
+    def notify_listeners(self, event_type: str, payload: dict) -> None:
+        """
+        Called by client implementations from their websocket handlers on account/order updates
+        """
+        for callback in getattr(self, 'listeners', None) or []:
+            callback(event_type, payload)
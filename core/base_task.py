@@ -1,36 +1,65 @@
-import orjson
-from aio_pika import Message, ExchangeType, connect_robust
+import asyncio
+
+from aio_pika import connect_robust
 
-from clients.binance import BinanceClient
-from clients.dydx import DydxClient
 from config import Config
+from core.client_pool import ClientPool
+from core.exposure import ExposureEngine
+from core.metrics import Metrics
+from core.outbox import Outbox
+from core.publisher import Publisher
+from core.session_pool import SessionPool
 
 
 class BaseTask:
-    __slots__ = 'mq', 'clients'
+    __slots__ = 'mq', 'clients', 'client_pool', 'sessions', 'publisher', 'outbox', 'exposure', 'workers', 'metrics'
 
-    def __init__(self):
+    def __init__(self, app, symbol: str = None):
         self.mq = None
-        self.clients = {
-            # BitmexClient(Config.BITMEX, Config.LEVERAGE),
-            'DYDX': DydxClient(Config.DYDX, Config.LEVERAGE),
-            'BINANCE': BinanceClient(Config.BINANCE, Config.LEVERAGE),
-            # ApolloxClient(Config.APOLLOX, Config.LEVERAGE),
-            # OkxClient(Config.OKX, Config.LEVERAGE),
-            # KrakenClient(Config.KRAKEN, Config.LEVERAGE)
-        }
-
-    @staticmethod
-    async def publish_message(connect, message, routing_key, exchange_name, queue_name):
-        channel = await connect.channel()
-        exchange = await channel.declare_exchange(exchange_name, type=ExchangeType.DIRECT, durable=True)
-        queue = await channel.declare_queue(queue_name, durable=True)
-        await queue.bind(exchange, routing_key=routing_key)
-        message_body = orjson.dumps(message)
-        message = Message(message_body)
-        await exchange.publish(message, routing_key=routing_key)
-        await channel.close()
-        return True
+
+        if app.get('metrics') is None:
+            app['metrics'] = Metrics()
+
+        self.metrics = app['metrics']
+
+        if app.get('clients') is None:
+            app['clients'] = ClientPool(metrics=self.metrics)
+
+        self.client_pool = app['clients']
+        self.clients = self.client_pool.for_symbol(symbol)
+
+        if app.get('sessions') is None:
+            app['sessions'] = SessionPool()
+
+        self.sessions = app['sessions']
+
+        if app.get('publisher') is None and app.get('mq') is not None:
+            app['publisher'] = Publisher(app['mq'])
+
+        self.publisher = app.get('publisher')
+
+        if app.get('outbox') is None and self.publisher is not None:
+            app['outbox'] = Outbox(self.publisher)
+
+        self.outbox = app.get('outbox')
+
+        if app.get('exposure') is None:
+            app['exposure'] = ExposureEngine(exchanges=list(self.clients))
+
+        self.exposure = app['exposure']
+        self.workers = app.get('workers')
+
+    async def publish_message(self, message, routing_key, exchange_name, queue_name):
+        return await self.publisher.publish(message, routing_key, exchange_name, queue_name)
+
+    async def run_in_worker(self, func, *args):
+        """
+        Run a CPU-heavy picklable function in the worker processes, inline when none are configured
+        """
+        if self.workers is None:
+            return func(*args)
+
+        return await asyncio.get_event_loop().run_in_executor(self.workers, func, *args)
 
     async def setup_mq(self, event_loop) -> None:
         self.mq = await connect_robust(
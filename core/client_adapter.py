@@ -0,0 +1,169 @@
+import asyncio
+import functools
+import threading
+
+from core.base_client import BaseClient
+
+
+class SyncClientAdapter(BaseClient):
+    """
+    Async BaseClient over a legacy client with blocking REST methods.
+
+    Blocking methods run in the exchange's bounded thread pool under a timeout, so the event loop
+    never waits for exchange I/O, async methods of the client are awaited under the same timeout.
+    get_orderbook reads the client's websocket state directly, other attributes are the client's own.
+
+    Legacy clients report the id of a new order only in LAST_ORDER_ID, create_order reads it right after
+    the order returns and adds it to the response as exchange_order_id unless the response has one.
+    LAST_ORDER_ID may be shared by all clients of the exchange: blocking create_order calls hold
+    `order_lock` and async ones hold `async_order_lock` across the call and the read.
+    """
+
+    def __init__(self, client, executor, timeout: float, order_lock: threading.Lock = None,
+                 async_order_lock: asyncio.Lock = None):
+        self.client = client
+        self.executor = executor
+        self.timeout = timeout
+        self.order_lock = order_lock or threading.Lock()
+        self.async_order_lock = async_order_lock or asyncio.Lock()
+        self.EXCHANGE_NAME = client.EXCHANGE_NAME
+
+    def __getattr__(self, name: str):
+        if name == 'client':
+            raise AttributeError(name)
+
+        return getattr(self.client, name)
+
+    @property
+    def LAST_ORDER_ID(self) -> str:  # noqa
+        return self.client.LAST_ORDER_ID
+
+    @property
+    def symbol(self) -> str:
+        return self.client.symbol
+
+    @symbol.setter
+    def symbol(self, symbol: str) -> None:
+        self.client.symbol = symbol
+
+    async def __run(self, method, *args, **kwargs):
+        if asyncio.iscoroutinefunction(method):
+            return await asyncio.wait_for(method(*args, **kwargs), self.timeout)
+
+        future = asyncio.get_event_loop().run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+
+        return await asyncio.wait_for(future, self.timeout)
+
+    async def get_available_balance(self, side: str) -> float:
+        return await self.__run(self.client.get_available_balance, side)
+
+    async def create_order(self, amount: float, price: float, side: str, session, **kwargs) -> dict:
+        method = self.__create_order_async if asyncio.iscoroutinefunction(self.client.create_order) \
+            else self.__create_order
+
+        return await self.__run(method, amount=amount, price=price, side=side, session=session, **kwargs)
+
+    async def __create_order_async(self, **kwargs) -> dict:
+        async with self.async_order_lock:
+            return self.__with_order_id(await self.client.create_order(**kwargs))
+
+    def __create_order(self, **kwargs) -> dict:
+        with self.order_lock:
+            return self.__with_order_id(self.client.create_order(**kwargs))
+
+    def __with_order_id(self, response: dict) -> dict:
+        response = response or {}
+
+        return {**response, 'exchange_order_id': response.get('exchange_order_id') or self.client.LAST_ORDER_ID}
+
+    async def get_order_by_id(self, order_ids, session) -> dict:
+        return await self.__run(self.client.get_order_by_id, order_ids, session)
+
+    async def cancel_all_orders(self, orderID=None) -> dict:
+        return await self.__run(self.client.cancel_all_orders, *(() if orderID is None else (orderID,)))
+
+    async def get_positions(self) -> dict:
+        return await self.__run(self.client.get_positions)
+
+    async def get_real_balance(self) -> float:
+        return await self.__run(self.client.get_real_balance)
+
+    def get_orderbook(self) -> dict:
+        return self.client.get_orderbook()
+
+    async def get_last_price(self, side: str) -> float:
+        return await self.__run(self.client.get_last_price, side)
+
+    def add_listener(self, callback) -> None:
+        self.client.add_listener(callback)
+
+    def notify_listeners(self, event_type: str, payload: dict) -> None:
+        self.client.notify_listeners(event_type, payload)
+
+
+class SymbolClient(BaseClient):
+    """
+    View of a shared multi-symbol client bound to one of its tickers.
+
+    All views of an exchange share the client's connection, updater and listeners. get_orderbook and
+    get_positions are keyed by ticker and read as they are. Calls acting on a symbol (orders, order
+    lookups, cancels, last price) read the client's `symbol` attribute, they run one at a time per
+    client with the attribute set to the view's ticker.
+    """
+
+    def __init__(self, client, symbol: str, lock: asyncio.Lock):
+        self.client = client
+        self.symbol = symbol
+        self.lock = lock
+        self.EXCHANGE_NAME = client.EXCHANGE_NAME
+
+    def __getattr__(self, name: str):
+        if name == 'client':
+            raise AttributeError(name)
+
+        return getattr(self.client, name)
+
+    @property
+    def LAST_ORDER_ID(self) -> str:  # noqa
+        return self.client.LAST_ORDER_ID
+
+    async def __call(self, name: str, *args, **kwargs):
+        method = getattr(self.client, name)
+
+        async with self.lock:
+            previous, self.client.symbol = self.client.symbol, self.symbol
+
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self.client.symbol = previous
+
+    async def get_available_balance(self, side: str) -> float:
+        return await self.client.get_available_balance(side)
+
+    async def create_order(self, amount: float, price: float, side: str, session, **kwargs) -> dict:
+        return await self.__call('create_order', amount=amount, price=price, side=side, session=session, **kwargs)
+
+    async def get_order_by_id(self, order_ids, session) -> dict:
+        return await self.__call('get_order_by_id', order_ids, session)
+
+    async def cancel_all_orders(self, orderID=None) -> dict:
+        return await self.__call('cancel_all_orders', *(() if orderID is None else (orderID,)))
+
+    async def get_positions(self) -> dict:
+        return await self.client.get_positions()
+
+    async def get_real_balance(self) -> float:
+        return await self.client.get_real_balance()
+
+    def get_orderbook(self) -> dict:
+        return self.client.get_orderbook()
+
+    async def get_last_price(self, side: str) -> float:
+        return await self.__call('get_last_price', side)
+
+    def add_listener(self, callback) -> None:
+        self.client.add_listener(callback)
+
+    def notify_listeners(self, event_type: str, payload: dict) -> None:
+        self.client.notify_listeners(event_type, payload)
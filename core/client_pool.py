@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from core.client_adapter import SymbolClient, SyncClientAdapter
+from core.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class ClientPool:
+    """
+    Process-wide registry of exchange clients.
+
+    Every client is built and its updater started exactly once per process, the same warm
+    instances are then handed to every task run by the consumer. One client per exchange serves all
+    coins (Config.BALANCING_SYMBOLS) over one connection, tasks get SymbolClient views of it grouped by
+    coin. Legacy sync clients are wrapped into SyncClientAdapter with one bounded executor per exchange.
+    Every exchange call waits for the shared RateLimiter first.
+    """
+    __slots__ = 'markets', 'clients', 'connections', 'executors', 'order_locks', 'async_order_locks', 'metrics', \
+                'limiter', '_started', '_ready'
+
+    def __init__(self, clients: dict = None, markets: dict = None, metrics=None, limiter: RateLimiter = None):
+        """
+        :param clients: exchange name -> client of Config.GLOBAL_SYMBOL
+        :param markets: coin -> exchange name -> client, a connection per client, shared clients by default
+        """
+        if clients is not None:
+            markets = {Config.GLOBAL_SYMBOL: clients}
+
+        self.executors = {}
+        self.order_locks = {}
+        self.async_order_locks = {}
+        self.limiter = RateLimiter(metrics=metrics) if limiter is None else limiter
+
+        if markets is None:
+            self.connections = {name: self.adapt(name, client) for name, client in self.build_clients().items()}
+            locks = {name: asyncio.Lock() for name in self.connections}
+            self.markets = {
+                coin: {name: SymbolClient(client, Config.SYMBOLS[coin][name], locks[name])
+                       for name, client in self.connections.items() if Config.SYMBOLS[coin][name]}
+                for coin in Config.BALANCING_SYMBOLS
+            }
+        else:
+            self.markets = {
+                symbol: {name: self.adapt(name, client) for name, client in clients.items()}
+                for symbol, clients in markets.items()
+            }
+            self.connections = dict(self.all_clients())
+
+        self.clients = next(iter(self.markets.values()), {})
+
+        for client in self.connections.values():
+            client.add_listener(self.limiter.listener(client.EXCHANGE_NAME))
+        self.metrics = metrics
+        self._started = False
+        self._ready = None
+
+    @staticmethod
+    def build_clients() -> dict:
+        """
+        :return: exchange name -> client subscribed to the tickers of all balanced coins, `symbols` in its config
+        """
+        from clients.binance import BinanceClient
+        from clients.dydx import DydxClient
+
+        classes = {
+            # 'BITMEX': (BitmexClient, Config.BITMEX),
+            'DYDX': (DydxClient, Config.DYDX),
+            'BINANCE': (BinanceClient, Config.BINANCE),
+            # 'APOLLOX': (ApolloxClient, Config.APOLLOX),
+            # 'OKX': (OkxClient, Config.OKX),
+            # 'KRAKEN': (KrakenClient, Config.KRAKEN)
+        }
+        clients = {}
+
+        for name, (client_class, settings) in classes.items():
+            tickers = [Config.SYMBOLS[coin][name] for coin in Config.BALANCING_SYMBOLS if Config.SYMBOLS[coin][name]]
+
+            if tickers:
+                clients[name] = client_class({**settings, 'symbol': tickers[0], 'symbols': tickers}, Config.LEVERAGE)
+
+        return clients
+
+    def adapt(self, name: str, client):
+        """
+        :return: client itself if it implements the async BaseClient contract, SyncClientAdapter otherwise
+        """
+        if asyncio.iscoroutinefunction(client.get_positions):
+            return client
+
+        if name not in self.executors:
+            self.executors[name] = ThreadPoolExecutor(max_workers=Config.CLIENT_EXECUTOR_WORKERS,
+                                                      thread_name_prefix=f'client-{name}')
+            self.order_locks[name] = threading.Lock()
+            self.async_order_locks[name] = asyncio.Lock()
+
+        return SyncClientAdapter(client, self.executors[name], Config.CLIENT_CALL_TIMEOUT, self.order_locks[name],
+                                 self.async_order_locks[name])
+
+    def for_symbol(self, symbol: str = None) -> dict:
+        """
+        :param symbol: coin from Config.BALANCING_SYMBOLS, first configured coin by default
+        :return: exchange name -> client
+        """
+        return self.clients if symbol is None else self.markets[symbol]
+
+    def client(self, exchange: str, symbol: str = None):
+        """
+        :param exchange: exchange name
+        :param symbol: coin from Config.BALANCING_SYMBOLS or the exchange's ticker of it,
+                       first configured coin by default
+        :return: client of the exchange bound to the symbol's ticker
+        """
+        if symbol is None or symbol in self.markets:
+            return self.for_symbol(symbol)[exchange]
+
+        for clients in self.markets.values():
+            if exchange in clients and clients[exchange].symbol == symbol:
+                return clients[exchange]
+
+        raise KeyError(f'No {exchange} client for symbol {symbol}')
+
+    def all_clients(self):
+        for symbol, clients in self.markets.items():
+            for client_name, client in clients.items():
+                yield f'{client_name}:{symbol}', client
+
+    def start(self) -> None:
+        """
+        Start websocket/REST updaters of all clients, repeated calls are no-op
+        :return: None
+        """
+        if self._started:
+            return
+
+        for client_name, client in self.connections.items():
+            client.run_updater()
+            logger.info(f'Started updater for {client_name}')
+
+        self._started = True
+
+    async def wait_ready(self, timeout: float = None) -> bool:
+        """
+        Wait until every client has a two-sided orderbook for its symbol
+
+        :param timeout: max seconds to wait, Config.CLIENTS_READY_TIMEOUT by default
+        :return: True if all clients are warm, False on timeout
+        """
+        if self._ready:
+            return True
+
+        self.start()
+        timeout = Config.CLIENTS_READY_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            not_ready = [name for name, client in self.all_clients() if not self.is_client_ready(client)]
+
+            if not not_ready:
+                self._ready = True
+                logger.info('All clients are ready')
+                return True
+
+            if time.monotonic() >= deadline:
+                logger.warning(f'Clients are not ready after {timeout}s: {not_ready}')
+                return False
+
+            await asyncio.sleep(Config.CLIENTS_READY_POLL)
+
+    @staticmethod
+    def is_client_ready(client) -> bool:
+        try:
+            orderbook = client.get_orderbook().get(client.symbol) or {}
+        except Exception:
+            return False
+
+        return bool(orderbook.get('asks')) and bool(orderbook.get('bids'))
+
+    async def call(self, method, *args, timeout: float = None, priority: int = None, **kwargs):
+        """
+        Await client method with rate limit, timeout and metrics, sync methods (get_orderbook) are in-memory reads
+        and run inline
+
+        :param method: bound client method
+        :param timeout: max seconds to wait for the result, time waiting for the rate limiter not included
+        :param priority: RequestPriority, by method by default
+        :return: method result
+        """
+        if not asyncio.iscoroutinefunction(method):
+            return method(*args, **kwargs)
+
+        exchange = getattr(getattr(method, '__self__', None), 'EXCHANGE_NAME', None)
+        await self.limiter.acquire(exchange, method.__name__, priority)
+
+        try:
+            if self.metrics is None:
+                return await asyncio.wait_for(method(*args, **kwargs), timeout)
+
+            with self.metrics.timer('exchange_call_seconds', exchange=exchange, method=method.__name__):
+                return await asyncio.wait_for(method(*args, **kwargs), timeout)
+
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.inc('exchange_call_errors_total', exchange=exchange, method=method.__name__)
+
+            if self.limiter.is_rejection(e):
+                self.limiter.update(exchange, getattr(e, 'headers', None), method.__name__, rejected=True)
+
+            raise
+
+        finally:
+            self.limiter.release(exchange)
+
+    def close(self) -> None:
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import traceback
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class CycleGuard:
+    """
+    Runs at most one cycle per key (balancing symbol) at a time.
+
+    Triggers arriving while a cycle runs are merged into a single follow-up run with the latest
+    trigger, every cycle holds a lease and is cancelled when it outlives it, so a hung exchange
+    call cannot block the key forever.
+    """
+    __slots__ = 'lease', 'running', 'pending'
+
+    def __init__(self, lease: float = None):
+        self.lease = lease or Config.TIMEOUT
+        self.running = set()
+        self.pending = {}
+
+    def is_running(self, key: str) -> bool:
+        return key in self.running
+
+    async def run(self, key: str, factory) -> bool:
+        """
+        Run the cycle now or merge it into the follow-up of the running one
+
+        :param key: cycle key, e.g. periodic routing key
+        :param factory: callable without arguments returning the cycle coroutine
+        :return: True if the cycle (and follow-ups merged meanwhile) ran in this call, False if merged
+        :raises: the first error of the cycles run in this call, follow-ups still run after it
+        """
+        if key in self.running:
+            self.pending[key] = factory
+            return False
+
+        self.running.add(key)
+        errors = []
+
+        try:
+            while factory is not None:
+                error = await self.__run_cycle(key, factory)
+
+                if error is not None:
+                    errors.append(error)
+
+                factory = self.pending.pop(key, None)
+
+        finally:
+            self.running.discard(key)
+            self.pending.pop(key, None)
+
+        if errors:
+            if len(errors) > 1:
+                logger.error(f'{len(errors)} cycles of {key} failed in one run, raising the first')
+
+            raise errors[0]
+
+        return True
+
+    async def __run_cycle(self, key: str, factory):
+        try:
+            await asyncio.wait_for(factory(), self.lease)
+
+        except asyncio.TimeoutError as e:
+            logger.error(f'Cycle {key} timed out after lease of {self.lease}s')
+            return e
+
+        except Exception as e:
+            logger.error(f'Error {e} in cycle {key}')
+            traceback.print_exc()
+            return e
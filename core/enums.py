@@ -16,6 +16,7 @@ class ConnectMethodEnum:
 class EventTypeEnum:
     ACCOUNT_UPDATE = 'ACCOUNT_UPDATE'
     ORDER_TRADE_UPDATE = 'ORDER_TRADE_UPDATE'
+    RATE_LIMIT = 'RATE_LIMIT'
 
 
 class BotState:
@@ -49,6 +50,16 @@ class ResponseStatus:
     ERROR = 'error'
 
 
+class RequestPriority:
+    """
+    Rate limiter classes, lower goes first
+    """
+    CANCEL = 0
+    ORDER = 1
+    QUERY = 2
+    TELEMETRY = 3
+
+
 class OrderStatus:
     NOT_EXECUTED = 'Not Executed'
     DELAYED_FULLY_EXECUTED = 'Delayed Fully Executed'
@@ -57,5 +68,26 @@ class OrderStatus:
 
 
 class ClientsOrderStatuses:
+    """
+    Order statuses as exchanges report them, final ones map to OrderStatus
+    """
+    OPEN = ['NEW', 'OPEN', 'PENDING', 'UNTRIGGERED', 'BEST_EFFORT_OPENED']
+    PARTIALLY_EXECUTED = ['PARTIALLY_FILLED']
     DELAYED_FULLY_EXECUTED = ['FILLED']
-    NOT_EXECUTED = ['CANCELED']
+    NOT_EXECUTED = ['CANCELED', 'CANCELLED', 'BEST_EFFORT_CANCELED', 'EXPIRED', 'REJECTED']
+
+    @classmethod
+    def to_order_status(cls, status: str, filled: float, instant: bool = False):
+        """
+        :param status: order status reported by the exchange
+        :param filled: filled amount in coin
+        :param instant: the status comes with the create_order response
+        :return: OrderStatus of a final status, None while the order is open
+        """
+        if status in cls.DELAYED_FULLY_EXECUTED:
+            return OrderStatus.INSTANT_FULLY_EXECUTED if instant else OrderStatus.DELAYED_FULLY_EXECUTED
+
+        if status in cls.NOT_EXECUTED:
+            return OrderStatus.PARTIALLY_EXECUTED if filled else OrderStatus.NOT_EXECUTED
+
+        return None
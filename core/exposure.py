@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class ExposureEngine:
+    """
+    Net coin/USD exposure per (exchange, symbol) kept in NumPy matrices.
+
+    Position updates are O(1): the cell is overwritten and the per-symbol net totals are moved by
+    the delta, so nothing is recomputed from scratch. Symbols are common coin names
+    (Config.GLOBAL_SYMBOL), not exchange tickers.
+    """
+    __slots__ = 'exchanges', 'symbols', 'coin', 'usd', 'net_coin', 'net_usd'
+
+    def __init__(self, exchanges: list = (), symbols: list = ()):
+        self.exchanges = {}
+        self.symbols = {}
+        self.coin = np.zeros((0, 0), dtype=np.float64)
+        self.usd = np.zeros((0, 0), dtype=np.float64)
+        self.net_coin = np.zeros(0, dtype=np.float64)
+        self.net_usd = np.zeros(0, dtype=np.float64)
+
+        for exchange in exchanges:
+            self.__exchange_index(exchange)
+
+        for symbol in symbols:
+            self.__symbol_index(symbol)
+
+    def __exchange_index(self, exchange: str) -> int:
+        index = self.exchanges.get(exchange)
+
+        if index is None:
+            index = self.exchanges[exchange] = len(self.exchanges)
+            self.coin = np.pad(self.coin, ((0, 1), (0, 0)))
+            self.usd = np.pad(self.usd, ((0, 1), (0, 0)))
+
+        return index
+
+    def __symbol_index(self, symbol: str) -> int:
+        index = self.symbols.get(symbol)
+
+        if index is None:
+            index = self.symbols[symbol] = len(self.symbols)
+            self.coin = np.pad(self.coin, ((0, 0), (0, 1)))
+            self.usd = np.pad(self.usd, ((0, 0), (0, 1)))
+            self.net_coin = np.pad(self.net_coin, (0, 1))
+            self.net_usd = np.pad(self.net_usd, (0, 1))
+
+        return index
+
+    def set_position(self, exchange: str, symbol: str, amount: float, amount_usd: float) -> None:
+        """
+        Overwrite position of symbol on exchange, signed: short positions are negative
+        """
+        e, s = self.__exchange_index(exchange), self.__symbol_index(symbol)
+        self.net_coin[s] += amount - self.coin[e, s]
+        self.net_usd[s] += amount_usd - self.usd[e, s]
+        self.coin[e, s] = amount
+        self.usd[e, s] = amount_usd
+
+    def apply_delta(self, exchange: str, symbol: str, amount: float, amount_usd: float) -> None:
+        """
+        Move position of symbol on exchange by a fill
+        """
+        e, s = self.__exchange_index(exchange), self.__symbol_index(symbol)
+        self.coin[e, s] += amount
+        self.usd[e, s] += amount_usd
+        self.net_coin[s] += amount
+        self.net_usd[s] += amount_usd
+
+    def net(self, symbol: str) -> tuple:
+        """
+        :return: (coin, usd) net exposure of symbol over all exchanges
+        """
+        s = self.symbols.get(symbol)
+
+        if s is None:
+            return 0.0, 0.0
+
+        return float(self.net_coin[s]), float(self.net_usd[s])
+
+    def recalculate(self) -> None:
+        """
+        Rebuild net totals from the matrices to drop accumulated float error
+        """
+        self.net_coin = self.coin.sum(axis=0)
+        self.net_usd = self.usd.sum(axis=0)
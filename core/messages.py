@@ -0,0 +1,171 @@
+import datetime
+import struct
+import uuid
+from typing import TypedDict
+
+import msgpack
+import orjson
+
+JSON = 'application/json'
+MSGPACK = 'application/x-msgpack'
+
+UUID_EXT = 1
+DATETIME_EXT = 2
+
+
+# records are plain dicts typed by these schemas, orjson encodes them as they are on the JSON path
+class OrderRecord(TypedDict):
+    """
+    RabbitMqQueues.ORDERS record
+    """
+    id: uuid.UUID
+    datetime: datetime.datetime
+    ts: float
+    context: str
+    parent_id: uuid.UUID
+    exchange_order_id: str
+    type: str
+    status: str
+    exchange: str
+    side: str
+    symbol: str
+    expect_price: float
+    expect_amount_coin: float
+    expect_amount_usd: float
+    expect_fee: float
+    factual_price: float
+    factual_amount_coin: float
+    factual_amount_usd: float
+    factual_fee: float
+    order_place_time: float
+    env: str
+
+
+class OrderUpdateRecord(TypedDict):
+    """
+    RabbitMqQueues.UPDATE_ORDERS record of a final order status, id is the one of its OrderRecord
+    """
+    id: uuid.UUID
+    datetime: datetime.datetime
+    ts: float
+    exchange_order_id: str
+    exchange: str
+    status: str
+    factual_price: float
+    factual_amount_coin: float
+    factual_amount_usd: float
+    factual_fee: float
+    order_fill_time: float
+
+
+class BalanceDetalizationRecord(TypedDict):
+    """
+    RabbitMqQueues.BALANCE_DETALIZATION record
+    """
+    id: uuid.UUID
+    datetime: datetime.datetime
+    ts: float
+    context: str
+    parent_id: uuid.UUID
+    exchange: str
+    symbol: str
+    max_margin: float
+    current_margin: float
+    position_coin: float
+    position_usd: float
+    entry_price: float
+    mark_price: float
+
+
+class DisbalanceRecord(TypedDict):
+    """
+    RabbitMqQueues.DISBALANCE record
+    """
+    id: uuid.UUID
+    datetime: datetime.datetime
+    ts: float
+    coin_name: str
+    position_coin: float
+    position_usd: float
+    price: float
+
+
+RECORD_TYPES = {record.__name__: record for record in (OrderRecord, OrderUpdateRecord, BalanceDetalizationRecord,
+                                                       DisbalanceRecord)}
+# field names in declaration order -> record type name, records built with all fields in this order pack as rows
+RECORD_NAMES = {tuple(record.__annotations__): name for name, record in RECORD_TYPES.items()}
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def _default(value):
+    if isinstance(value, uuid.UUID):
+        return msgpack.ExtType(UUID_EXT, value.bytes)
+
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+        return msgpack.ExtType(DATETIME_EXT, struct.pack('>q', (value - EPOCH) // MICROSECOND))
+
+    raise TypeError(f'Cannot serialize {type(value)}')
+
+
+def _ext_hook(code: int, data: bytes):
+    """
+    UUIDs and datetimes decode to the strings orjson produces for them, so payloads match the JSON ones
+    """
+    if code == UUID_EXT:
+        value = data.hex()
+        return f'{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}'
+
+    if code == DATETIME_EXT:
+        return (EPOCH + struct.unpack('>q', data)[0] * MICROSECOND).isoformat()
+
+    return msgpack.ExtType(code, data)
+
+
+def encode(records: list, content_type: str = JSON) -> list:
+    """
+    Encode records (record types above or dicts) into AMQP message bodies
+
+    JSON gives one message per record in the format current consumers read. MSGPACK packs all records
+    into one message, records of one type built with its fields in declaration order as positional rows
+    named by the x-record header.
+
+    :return: list of (body, headers)
+    """
+    if content_type == JSON:
+        return [(orjson.dumps(record), {}) for record in records]
+
+    fields = tuple(records[0]) if records else ()
+    headers = {'x-count': len(records)}
+
+    if fields in RECORD_NAMES and all(tuple(record) == fields for record in records):
+        headers['x-record'] = RECORD_NAMES[fields]
+        records = [tuple(record.values()) for record in records]
+
+    return [(msgpack.packb(records, default=_default), headers)]
+
+
+def decode(body: bytes, content_type: str = None, headers: dict = None) -> list:
+    """
+    Decode an AMQP message body of either content type, messages without content type are JSON
+
+    :return: list of payload dicts, equal for both content types
+    """
+    if content_type != MSGPACK:
+        payload = orjson.loads(body)
+        return payload if isinstance(payload, list) else [payload]
+
+    rows = msgpack.unpackb(body, ext_hook=_ext_hook)
+    record_type = RECORD_TYPES.get((headers or {}).get('x-record'))
+
+    if record_type is None:
+        return rows
+
+    fields = tuple(record_type.__annotations__)
+
+    return [dict(zip(fields, row)) for row in rows]
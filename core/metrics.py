@@ -0,0 +1,155 @@
+import asyncio
+import contextlib
+import logging
+import math
+import time
+
+import numpy as np
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """
+    Latency histogram in fixed memory.
+
+    Values between MIN_VALUE and MAX_VALUE seconds fall into log-linear buckets, SUB_BUCKETS per
+    power of two as in HdrHistogram, so a quantile is off by less than 1 / SUB_BUCKETS of its value.
+    """
+    MIN_VALUE = 1e-6
+    MAX_VALUE = 1e3
+    SUB_BUCKETS = 16
+    BUCKETS = SUB_BUCKETS * math.ceil(math.log2(MAX_VALUE / MIN_VALUE))
+
+    __slots__ = 'counts', 'count', 'total', 'max'
+
+    def __init__(self):
+        self.counts = np.zeros(self.BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def bucket(cls, value: float) -> int:
+        mantissa, exponent = math.frexp(max(value / cls.MIN_VALUE, 1))
+
+        return min((exponent - 1) * cls.SUB_BUCKETS + int((2 * mantissa - 1) * cls.SUB_BUCKETS), cls.BUCKETS - 1)
+
+    @classmethod
+    def upper_bound(cls, bucket: int) -> float:
+        exponent, sub_bucket = divmod(bucket, cls.SUB_BUCKETS)
+
+        return cls.MIN_VALUE * 2 ** exponent * (1 + (sub_bucket + 1) / cls.SUB_BUCKETS)
+
+    def record(self, value: float) -> None:
+        self.counts[self.bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q * self.count))
+
+        return min(self.upper_bound(bucket), self.max)
+
+
+class Metrics:
+    """
+    Process metrics registry: latency histograms, counters and event loop lag.
+
+    Metrics are keyed by name and labels and rendered in the Prometheus text format, histograms
+    as summaries with QUANTILES, handler() serves them on the consumer's aiohttp Application.
+    """
+    QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+    __slots__ = 'histograms', 'counters', '_lag_task'
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lag_task = None
+
+    @staticmethod
+    def __key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self.__key(name, labels)
+        histogram = self.histograms.get(key)
+
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+
+        histogram.record(value)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = self.__key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Observe the seconds spent in the with block, also when it raises
+        """
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def __labels(labels: tuple, *extra) -> str:
+        labels = labels + extra
+
+        return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}' if labels else ''
+
+    def render(self) -> str:
+        lines = []
+        typed = set()
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} summary')
+
+            for q in self.QUANTILES:
+                lines.append(f'{name}{self.__labels(labels, ("quantile", q))} {histogram.quantile(q):.9g}')
+
+            lines.append(f'{name}_sum{self.__labels(labels)} {histogram.total:.9g}')
+            lines.append(f'{name}_count{self.__labels(labels)} {histogram.count}')
+
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} counter')
+
+            lines.append(f'{name}{self.__labels(labels)} {value:.9g}')
+
+        return '\n'.join(lines) + '\n'
+
+    async def handler(self, request) -> web.Response:
+        return web.Response(text=self.render(), content_type='text/plain')
+
+    def start_loop_monitor(self, interval: float) -> None:
+        """
+        Measure event loop lag: how late a sleep of `interval` seconds wakes up
+        """
+        if self._lag_task is None or self._lag_task.done():
+            self._lag_task = asyncio.get_event_loop().create_task(self.__monitor_loop(interval))
+
+    async def __monitor_loop(self, interval: float) -> None:
+        loop = asyncio.get_event_loop()
+
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.observe('event_loop_lag_seconds', max(loop.time() - started - interval, 0))
+
+    def stop(self) -> None:
+        if self._lag_task is not None:
+            self._lag_task.cancel()
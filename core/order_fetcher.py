@@ -0,0 +1,117 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from config import Config
+from core.enums import RabbitMqQueues, RequestPriority
+from core.messages import JSON
+
+logger = logging.getLogger(__name__)
+
+
+class OrderResultsFetcher:
+    """
+    Coalesces order result lookups per exchange and symbol.
+
+    Order ids submitted within a short window are deduplicated and queried in chunks,
+    concurrently under a per-exchange budget, with bounded exponential backoff on disconnects.
+    The results of all chunks of a batch are published to UPDATE_ORDERS with one publish_batch call,
+    in the format get_order_by_id returns and Config.MESSAGE_FORMATS, before the submitters resume.
+    A failed chunk fails only the submitters of its ids, the other chunks of the batch are still
+    published. Lookups go through the ClientPool rate limiter as telemetry, rate limit rejections are
+    retried once it lets them pass.
+    """
+    RETRY_ERRORS = (aiohttp.ServerDisconnectedError, aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+    __slots__ = 'client_pool', 'sessions', 'publisher', 'window', 'chunk_size', 'retries', 'backoff', \
+                'max_backoff', 'budgets', 'pending'
+
+    def __init__(self, client_pool, sessions, publisher, settings: dict = None):
+        settings = settings or Config.ORDER_RESULTS
+        self.client_pool = client_pool
+        self.sessions = sessions
+        self.publisher = publisher
+        self.window = settings['window']
+        self.chunk_size = settings['chunk_size']
+        self.retries = settings['retries']
+        self.backoff = settings['backoff']
+        self.max_backoff = settings['max_backoff']
+        self.budgets = {exchange: asyncio.Semaphore(settings['max_concurrent']) for exchange in client_pool.clients}
+        self.pending = {}
+
+    async def submit(self, exchange: str, order_ids, symbol: str = None) -> None:
+        """
+        Queue order ids for lookup and wait until their results are published
+
+        :param exchange: exchange name as in BaseTask.clients
+        :param order_ids: exchange order id or list of ids
+        :param symbol: coin or exchange ticker of the orders, first configured coin by default
+        :return: None
+        """
+        loop = asyncio.get_event_loop()
+        client = self.client_pool.client(exchange, symbol)
+        batch = self.pending.get(client)
+
+        if batch is None:
+            batch = self.pending[client] = {}
+            loop.call_later(self.window, lambda: loop.create_task(self.__flush(client)))
+
+        futures = [batch[order_id] if order_id in batch else batch.setdefault(order_id, loop.create_future())
+                   for order_id in (order_ids if isinstance(order_ids, (list, tuple)) else [order_ids])]
+
+        await asyncio.shield(asyncio.gather(*futures))
+
+    async def __flush(self, client) -> None:
+        batch = self.pending.pop(client)
+        exchange = client.EXCHANGE_NAME
+        ids = list(batch)
+        chunks = [ids[i:i + self.chunk_size] for i in range(0, len(ids), self.chunk_size)]
+        results = await asyncio.gather(*[self.__fetch(client, chunk) for chunk in chunks], return_exceptions=True)
+        logger.info(f'{exchange} {client.symbol}: {len(ids)} orders in {len(chunks)} requests')
+
+        records = [record for result in results if result and not isinstance(result, BaseException)
+                   for record in (result if isinstance(result, list) else [result])]
+        error = None
+
+        if records:
+            try:
+                await self.publisher.publish_batch(records, RabbitMqQueues.UPDATE_ORDERS,
+                                                   RabbitMqQueues.get_exchange_name(RabbitMqQueues.UPDATE_ORDERS),
+                                                   RabbitMqQueues.UPDATE_ORDERS,
+                                                   Config.MESSAGE_FORMATS.get(RabbitMqQueues.UPDATE_ORDERS, JSON))
+            except Exception as e:
+                logger.warning(f'Error {e!r} while publishing {exchange} order results')
+                error = e
+
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                logger.warning(f'Error {result!r} while fetching {exchange} orders {chunk}')
+            elif error is not None:
+                result = error
+
+            for order_id in chunk:
+                if isinstance(result, BaseException):
+                    batch[order_id].set_exception(result)
+                else:
+                    batch[order_id].set_result(None)
+
+    async def __fetch(self, client, order_ids: list):
+        exchange = client.EXCHANGE_NAME
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.budgets[exchange]:
+                    return await self.client_pool.call(client.get_order_by_id, order_ids, self.sessions.get(exchange),
+                                                       priority=RequestPriority.TELEMETRY)
+
+            except Exception as e:
+                rejected = self.client_pool.limiter.is_rejection(e)
+
+                if (not rejected and not isinstance(e, self.RETRY_ERRORS)) or attempt == self.retries:
+                    raise
+
+                # the rate limiter already holds rejected requests back
+                delay = 0 if rejected else min(self.backoff * 2 ** attempt, self.max_backoff)
+                logger.warning(f'Error {e!r} while fetching {exchange} orders, retry in {delay}s')
+                await asyncio.sleep(delay)
@@ -0,0 +1,283 @@
+import asyncio
+import datetime
+import logging
+import time
+
+from config import Config
+from core.enums import ClientsOrderStatuses, EventTypeEnum, OrderStatus, RabbitMqQueues
+from core.messages import OrderUpdateRecord
+
+logger = logging.getLogger(__name__)
+
+
+class TrackedOrder:
+    __slots__ = 'client', 'order_id', 'record_id', 'amount', 'placed_at', 'deadline', 'interval', 'next_poll', \
+                'filled', 'result', 'done'
+
+    def __init__(self, client, order_id: str, record_id, amount: float, placed_at: float, deadline: float,
+                 first_poll: float, done: asyncio.Future):
+        self.client = client
+        self.order_id = order_id
+        self.record_id = record_id
+        self.amount = amount
+        self.placed_at = placed_at
+        self.deadline = deadline
+        self.interval = first_poll
+        self.next_poll = placed_at + first_poll
+        self.filled = 0.0
+        self.result = {}
+        self.done = done
+
+
+class OrderTracker:
+    """
+    Follows orders placed by balancing until their final status.
+
+    Orders are keyed by exchange, ticker and exchange order id. The create_order response is checked first,
+    open orders are then polled with one get_order_by_id call per client for every order due: each
+    order waits first_poll seconds, the interval grows by backoff up to max_poll while nothing fills
+    and drops back to first_poll on every fill. ORDER_TRADE_UPDATE events of the client stream settle
+    orders directly or bring their next poll forward. The UPDATE_ORDERS record is published once per
+    order, orders still open after timeout are published with the amount filled so far.
+    """
+    __slots__ = 'client_pool', 'sessions', 'outbox', 'metrics', 'first_poll', 'max_poll', 'backoff', 'timeout', \
+                'chunk_size', 'orders', 'pollers', 'wakeups', 'listening', 'loop'
+
+    def __init__(self, client_pool, sessions, outbox, settings: dict = None, metrics=None):
+        settings = settings or Config.ORDER_TRACKER
+        self.client_pool = client_pool
+        self.sessions = sessions
+        self.outbox = outbox
+        self.metrics = metrics
+        self.first_poll = settings['first_poll']
+        self.max_poll = settings['max_poll']
+        self.backoff = settings['backoff']
+        self.timeout = settings['timeout']
+        self.chunk_size = settings['chunk_size']
+        self.orders = {}
+        self.pollers = {}
+        self.wakeups = {}
+        self.listening = set()
+        self.loop = None
+
+    async def track(self, client, order_id: str, record_id, amount: float, response: dict = None) -> asyncio.Future:
+        """
+        Start tracking a placed order
+
+        :param client: client the order was placed with
+        :param order_id: exchange order id
+        :param record_id: id of the order's OrderRecord
+        :param amount: ordered amount in coin
+        :param response: create_order response, settles the order at once if it has a final status
+        :return: future of the published OrderUpdateRecord
+        """
+        self.loop = asyncio.get_event_loop()
+        key = self.key(client, order_id)
+
+        if key in self.orders:
+            return self.orders[key].done
+
+        now = self.loop.time()
+        order = self.orders[key] = TrackedOrder(client, order_id, record_id, amount, now, now + self.timeout,
+                                                self.first_poll, self.loop.create_future())
+
+        if response is not None and await self.__apply(order, response, instant=True):
+            return order.done
+
+        self.__listen(client)
+
+        if client not in self.pollers:
+            self.wakeups[client] = asyncio.Event()
+            self.pollers[client] = self.loop.create_task(self.__poll(client))
+
+        return order.done
+
+    @staticmethod
+    def key(client, order_id: str) -> tuple:
+        return client.EXCHANGE_NAME, client.symbol, order_id
+
+    def __listen(self, client) -> None:
+        if client in self.listening:
+            return
+
+        def callback(event_type, payload):
+            if event_type == EventTypeEnum.ORDER_TRADE_UPDATE:
+                self.loop.call_soon_threadsafe(self.on_order_update, client, payload)
+
+        client.add_listener(callback)
+        self.listening.add(client)
+
+    def on_order_update(self, client, payload: dict) -> None:
+        """
+        Settle the order from an UPDATE_ORDERS formatted event, events of unknown format make all open orders
+        of the client due for polling. Events of other tickers of a shared client and of orders not tracked
+        are skipped.
+        """
+        payload = payload or {}
+
+        if payload.get('symbol') is not None and payload['symbol'] != client.symbol:
+            return
+
+        if payload.get('exchange_order_id') and payload.get('status') is not None:
+            order = self.orders.get(self.key(client, payload['exchange_order_id']))
+
+            if order is not None:
+                self.loop.create_task(self.__apply(order, payload))
+
+            return
+
+        self.refresh(client)
+
+    def filled(self, client, order_id: str) -> float:
+        """
+        :return: amount filled so far of an open order, 0 for orders not tracked
+        """
+        order = self.orders.get(self.key(client, order_id))
+
+        return order.filled if order is not None else 0.0
+
+    def refresh(self, client) -> None:
+        """
+        Poll all open orders of the client now, e.g. after cancelling them
+        """
+        now = self.loop.time()
+
+        for order in self.orders.values():
+            if order.client is client:
+                order.next_poll = now
+
+        if client in self.wakeups:
+            self.wakeups[client].set()
+
+    async def __poll(self, client) -> None:
+        wakeup = self.wakeups[client]
+
+        try:
+            while True:
+                orders = [order for order in self.orders.values() if order.client is client]
+
+                if not orders:
+                    return
+
+                delay = min(order.next_poll for order in orders) - self.loop.time()
+
+                if delay > 0:
+                    wakeup.clear()
+
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+
+                    continue
+
+                now = self.loop.time()
+                due = [order for order in orders if order.next_poll <= now]
+
+                for i in range(0, len(due), self.chunk_size):
+                    await self.__check(client, due[i:i + self.chunk_size])
+
+        except Exception as e:
+            logger.exception(f'Order polling of {client.EXCHANGE_NAME} failed: {e!r}')
+
+        finally:
+            del self.pollers[client]
+            del self.wakeups[client]
+
+    async def __check(self, client, orders: list) -> None:
+        order_ids = [order.order_id for order in orders]
+
+        try:
+            results = await self.client_pool.call(client.get_order_by_id, order_ids,
+                                                  self.sessions.get(client.EXCHANGE_NAME),
+                                                  timeout=Config.CLIENT_CALL_TIMEOUT)
+        except Exception as e:
+            logger.warning(f'Error {e!r} while polling {client.EXCHANGE_NAME} orders {order_ids}')
+            results = []
+
+        if isinstance(results, dict):
+            results = [results]
+
+        if len(orders) == 1 and len(results or []) == 1:
+            results = {orders[0].order_id: results[0]}
+        else:
+            results = {result.get('exchange_order_id'): result for result in results or []}
+
+        now = self.loop.time()
+
+        for order in orders:
+            if self.key(order.client, order.order_id) not in self.orders:
+                continue
+
+            result = results.get(order.order_id)
+
+            if result is not None and await self.__apply(order, result):
+                continue
+
+            if now >= order.deadline:
+                logger.warning(f'{client.EXCHANGE_NAME} order {order.order_id} is open after {self.timeout}s')
+                await self.__finish(order, OrderStatus.PARTIALLY_EXECUTED if order.filled else OrderStatus.NOT_EXECUTED)
+                continue
+
+            order.next_poll = min(now + order.interval, order.deadline)
+            order.interval = min(order.interval * self.backoff, self.max_poll)
+
+    async def __apply(self, order: TrackedOrder, result: dict, instant: bool = False) -> bool:
+        """
+        :return: True if the order is final and published
+        """
+        if self.key(order.client, order.order_id) not in self.orders:
+            return True
+
+        filled = float(result.get('factual_amount_coin') or 0)
+
+        if filled > order.filled:
+            order.interval = self.first_poll
+
+        order.filled = max(order.filled, filled)
+        order.result = result
+        status = ClientsOrderStatuses.to_order_status(result.get('status'), filled, instant)
+
+        if status is None:
+            return False
+
+        await self.__finish(order, status)
+        return True
+
+    async def __finish(self, order: TrackedOrder, status: str) -> None:
+        del self.orders[self.key(order.client, order.order_id)]
+        exchange = order.client.EXCHANGE_NAME
+        fill_time = self.loop.time() - order.placed_at
+        result = order.result
+        record: OrderUpdateRecord = {
+            'id': order.record_id,
+            'datetime': datetime.datetime.utcnow(),
+            'ts': time.time(),
+            'exchange_order_id': order.order_id,
+            'exchange': exchange,
+            'status': status,
+            'factual_price': result.get('factual_price', 0),
+            'factual_amount_coin': order.filled,
+            'factual_amount_usd': result.get('factual_amount_usd', 0),
+            'factual_fee': result.get('factual_fee', order.client.taker_fee),
+            'order_fill_time': fill_time
+        }
+
+        if self.metrics is not None:
+            self.metrics.observe('order_fill_seconds', fill_time, exchange=exchange, status=status)
+
+        order.done.set_result(record)
+        await self.outbox.put(record, RabbitMqQueues.UPDATE_ORDERS)
+
+    async def flush(self, timeout: float = None) -> None:
+        """
+        Wait until every tracked order is final and published
+        """
+        pending = [order.done for order in self.orders.values()]
+
+        if pending:
+            await asyncio.wait_for(asyncio.gather(*pending), timeout)
+
+    def stop(self) -> None:
+        for poller in list(self.pollers.values()):
+            poller.cancel()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+
+from config import Config
+from core.enums import RabbitMqQueues
+from core.messages import JSON
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    """
+    Bounded in-memory outbox for telemetry records.
+
+    Records are published by a background task in batches, concurrently and with publisher
+    confirms, so callers only pay for an enqueue. A full outbox makes put() wait (backpressure).
+    """
+    RETRY_DELAY = 0.1
+
+    __slots__ = 'publisher', 'queue', 'batch_size', 'flush_interval', 'retries', 'shutdown_timeout', '_task'
+
+    def __init__(self, publisher, settings: dict = None):
+        settings = settings or Config.OUTBOX
+        self.publisher = publisher
+        self.queue = asyncio.Queue(maxsize=settings['max_size'])
+        self.batch_size = settings['batch_size']
+        self.flush_interval = settings['flush_interval']
+        self.retries = settings['retries']
+        self.shutdown_timeout = settings['shutdown_timeout']
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self.__run())
+
+    async def put(self, message, routing_key: str) -> None:
+        """
+        Enqueue record for publishing, waits only when the outbox is full
+
+        :param message: dict or record from core.messages
+        :param routing_key: one of RabbitMqQueues.*
+        :return: None
+        """
+        self.start()
+        await self.queue.put((message, routing_key))
+
+    async def __run(self) -> None:
+        loop = asyncio.get_event_loop()
+
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self.__publish_batch(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    @staticmethod
+    def __group(batch: list) -> list:
+        """
+        Split records into publish units: single records for JSON routing keys, one unit per routing key
+        for batched formats (Config.MESSAGE_FORMATS)
+        """
+        units = []
+        grouped = {}
+
+        for message, routing_key in batch:
+            if Config.MESSAGE_FORMATS.get(routing_key, JSON) == JSON:
+                units.append(([message], routing_key))
+            else:
+                grouped.setdefault(routing_key, []).append(message)
+
+        return units + [(messages, routing_key) for routing_key, messages in grouped.items()]
+
+    async def __publish_unit(self, messages: list, routing_key: str) -> bool:
+        exchange_name = RabbitMqQueues.get_exchange_name(routing_key)
+
+        if len(messages) == 1:
+            return await self.publisher.publish(messages[0], routing_key, exchange_name, routing_key)
+
+        return await self.publisher.publish_batch(messages, routing_key, exchange_name, routing_key,
+                                                  Config.MESSAGE_FORMATS[routing_key])
+
+    async def __publish_batch(self, batch: list) -> None:
+        units = self.__group(batch)
+
+        for attempt in range(self.retries + 1):
+            results = await asyncio.gather(*[
+                self.__publish_unit(messages, routing_key) for messages, routing_key in units
+            ], return_exceptions=True)
+            failed = [(unit, result) for unit, result in zip(units, results) if isinstance(result, Exception)]
+
+            if not failed:
+                return
+
+            logger.warning(f'{len(failed)} publishes failed: {failed[0][1]}, attempt {attempt + 1}')
+            units = [unit for unit, _ in failed]
+            await asyncio.sleep(self.RETRY_DELAY * 2 ** attempt)
+
+        logger.error(f'Dropped {sum(len(messages) for messages, _ in units)} records after {self.retries + 1} attempts')
+
+    async def flush(self) -> None:
+        """
+        Wait until every enqueued record is published or dropped
+        :return: None
+        """
+        self.start()
+        await self.queue.join()
+
+    async def stop(self) -> None:
+        try:
+            await asyncio.wait_for(self.flush(), self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f'Outbox flush timed out, {self.queue.qsize()} records lost')
+
+        if self._task is not None:
+            self._task.cancel()
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+import orjson
+from aio_pika import ExchangeType, Message
+from aio_pika.exceptions import AMQPChannelError, ChannelInvalidStateError
+
+from core.messages import JSON, encode
+
+logger = logging.getLogger(__name__)
+
+
+class Publisher:
+    """
+    Publishes messages over one cached channel per connection.
+
+    Exchange, queue and binding are declared once per routing key, the cache is dropped and
+    rebuilt on a fresh channel whenever the channel is lost.
+    """
+    __slots__ = 'connection', 'channel', 'exchanges', '_lock'
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.channel = None
+        self.exchanges = {}
+        self._lock = asyncio.Lock()
+
+    async def publish(self, message, routing_key: str, exchange_name: str, queue_name: str) -> bool:
+        """
+        Publish one record as JSON
+
+        :param message: dict or record from core.messages
+        """
+        return await self.__publish(orjson.dumps(message), JSON, {}, routing_key, exchange_name, queue_name)
+
+    async def publish_batch(self, records: list, routing_key: str, exchange_name: str, queue_name: str,
+                            content_type: str = JSON) -> bool:
+        """
+        Publish records encoded by core.messages.encode, MSGPACK sends them all in one message
+        """
+        for body, headers in encode(records, content_type):
+            await self.__publish(body, content_type, headers, routing_key, exchange_name, queue_name)
+
+        return True
+
+    async def __publish(self, body: bytes, content_type: str, headers: dict, routing_key: str, exchange_name: str,
+                        queue_name: str) -> bool:
+        try:
+            exchange = await self.__get_exchange(routing_key, exchange_name, queue_name)
+            await exchange.publish(Message(body, content_type=content_type, headers=headers), routing_key=routing_key)
+
+        except (AMQPChannelError, ChannelInvalidStateError) as e:
+            logger.warning(f'Channel lost while publishing to {routing_key}: {e}, redeclaring')
+            await self.reset()
+            exchange = await self.__get_exchange(routing_key, exchange_name, queue_name)
+            await exchange.publish(Message(body, content_type=content_type, headers=headers), routing_key=routing_key)
+
+        return True
+
+    async def __get_exchange(self, routing_key: str, exchange_name: str, queue_name: str):
+        exchange = self.exchanges.get(routing_key)
+
+        if exchange is not None and self.channel is not None and not self.channel.is_closed:
+            return exchange
+
+        async with self._lock:
+            if self.channel is None or self.channel.is_closed:
+                self.channel = await self.connection.channel()
+                self.exchanges = {}
+
+            if routing_key not in self.exchanges:
+                exchange = await self.channel.declare_exchange(exchange_name, type=ExchangeType.DIRECT, durable=True)
+                queue = await self.channel.declare_queue(queue_name, durable=True)
+                await queue.bind(exchange, routing_key=routing_key)
+                self.exchanges[routing_key] = exchange
+
+            return self.exchanges[routing_key]
+
+    async def reset(self) -> None:
+        async with self._lock:
+            channel, self.channel, self.exchanges = self.channel, None, {}
+
+        if channel is not None and not channel.is_closed:
+            try:
+                await channel.close()
+            except Exception as e:
+                logger.warning(f'Error {e} while closing channel')
+
+    async def close(self) -> None:
+        await self.reset()
+
+
+class LogPublisher:
+    """
+    Publisher stand-in for runs without a broker, messages are logged and dropped
+    """
+    __slots__ = ()
+
+    async def publish(self, message, routing_key: str, exchange_name: str, queue_name: str) -> bool:
+        logger.info(f'No broker, message to {routing_key}: {orjson.dumps(message).decode()}')
+
+        return True
+
+    async def publish_batch(self, records: list, routing_key: str, exchange_name: str, queue_name: str,
+                            content_type: str = JSON) -> bool:
+        for record in records:
+            await self.publish(record, routing_key, exchange_name, queue_name)
+
+        return True
+
+    async def reset(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
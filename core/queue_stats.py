@@ -0,0 +1,67 @@
+import time
+
+
+class QueueStats:
+    """
+    Throughput and latency counters of one consumed queue
+    """
+    __slots__ = 'started', 'received', 'done', 'failed', 'in_flight', 'peak_in_flight', 'wait_time', \
+                'busy_time', 'max_latency'
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.received = 0
+        self.done = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.wait_time = 0.0
+        self.busy_time = 0.0
+        self.max_latency = 0.0
+
+    def receive(self) -> float:
+        """
+        :return: receive time to pass to begin()
+        """
+        self.received += 1
+
+        return time.monotonic()
+
+    def begin(self, received_at: float) -> float:
+        """
+        Handler got its in-flight slot
+        :return: start time to pass to end()
+        """
+        now = time.monotonic()
+        self.wait_time += now - received_at
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        return now
+
+    def end(self, started_at: float, failed: bool = False) -> None:
+        latency = time.monotonic() - started_at
+        self.in_flight -= 1
+        self.busy_time += latency
+        self.max_latency = max(self.max_latency, latency)
+
+        if failed:
+            self.failed += 1
+        else:
+            self.done += 1
+
+    def stats(self) -> dict:
+        finished = self.done + self.failed
+        uptime = time.monotonic() - self.started
+
+        return {
+            'received': self.received,
+            'done': self.done,
+            'failed': self.failed,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'per_second': round(finished / uptime, 4) if uptime else 0,
+            'avg_wait': round(self.wait_time / (finished + self.in_flight), 6) if finished + self.in_flight else 0,
+            'avg_latency': round(self.busy_time / finished, 6) if finished else 0,
+            'max_latency': round(self.max_latency, 6)
+        }
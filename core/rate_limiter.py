@@ -0,0 +1,246 @@
+import asyncio
+import itertools
+import logging
+
+from config import Config
+from core.enums import EventTypeEnum, RequestPriority
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second up to `burst`, times are event loop times. An `updated` time in the future
+    is a pause, the bucket refills only after it
+    """
+    TOLERANCE = 1e-9
+
+    __slots__ = 'rate', 'burst', 'tokens', 'updated'
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """
+        :return: seconds until `cost` tokens are available, 0 if they are now
+        """
+        self.refill(now)
+        missing = min(cost, self.burst) - self.tokens
+
+        return max(self.updated - now, 0) + (missing / self.rate if missing > self.TOLERANCE else 0)
+
+    def take(self, cost: float) -> None:
+        self.tokens -= min(cost, self.burst)
+
+    def limit(self, remaining: float) -> None:
+        """
+        Lower the tokens to what the exchange reports as left
+        """
+        self.tokens = min(self.tokens, remaining)
+
+    def pause(self, until: float) -> None:
+        self.tokens = 0
+        self.updated = max(self.updated, until)
+
+
+class RateLimiter:
+    """
+    Request scheduler over per-exchange token buckets, shared by all calls of a ClientPool.
+
+    Every exchange in Config.RATE_LIMITS has a bucket for its total request weight and optional buckets
+    per endpoint (client method). Waiting requests are served by priority class, cancels before orders
+    before queries before telemetry and FIFO within a class: a request held by the exchange bucket holds
+    back all requests after it, one held only by its endpoint bucket lets other endpoints pass.
+
+    Rate headers of responses (RATE_LIMIT events of clients, headers of 429 errors) lower the buckets
+    to what the exchange reports as remaining, Retry-After pauses the exchange.
+    """
+    PRIORITIES = {
+        'cancel_all_orders': RequestPriority.CANCEL,
+        'create_order': RequestPriority.ORDER
+    }
+    REJECTED = (418, 429)
+    # timers may fire up to the loop's clock resolution early, the bucket would then miss a fraction of a token
+    TIMER_MARGIN = 1e-6
+    REMAINING_HEADERS = ('RateLimit-Remaining', 'X-RateLimit-Remaining', 'ratelimit-remaining',
+                         'x-ratelimit-remaining')
+
+    __slots__ = 'settings', 'pause', 'buckets', 'waiters', 'timers', 'in_flight', 'sequence', 'loop', 'metrics'
+
+    def __init__(self, settings: dict = None, pause: float = None, metrics=None):
+        self.settings = Config.RATE_LIMITS if settings is None else settings
+        self.pause = Config.RATE_LIMIT_PAUSE if pause is None else pause
+        self.buckets = {}
+        self.waiters = {}
+        self.timers = {}
+        self.in_flight = {}
+        self.sequence = itertools.count()
+        self.loop = None
+        self.metrics = metrics
+
+    def __bucket(self, exchange: str, endpoint: str = None):
+        key = (exchange, endpoint)
+
+        if key not in self.buckets:
+            limits = self.settings.get(exchange) or {}
+
+            if endpoint is not None:
+                limits = limits.get('endpoints', {}).get(endpoint) or {}
+
+            self.buckets[key] = TokenBucket(limits['rate'], limits.get('burst', limits['rate']),
+                                            self.loop.time()) if 'rate' in limits else None
+
+        return self.buckets[key]
+
+    def weight(self, exchange: str, endpoint: str) -> float:
+        return (self.settings.get(exchange) or {}).get('weights', {}).get(endpoint, 1)
+
+    def priority(self, endpoint: str) -> int:
+        return self.PRIORITIES.get(endpoint, RequestPriority.QUERY)
+
+    async def acquire(self, exchange: str, endpoint: str, priority: int = None, weight: float = None) -> float:
+        """
+        Wait until the request fits the exchange's and the endpoint's bucket, release() it once answered
+
+        :param exchange: EXCHANGE_NAME of the client
+        :param endpoint: client method name
+        :param priority: RequestPriority, by endpoint by default
+        :param weight: request weight, Config.RATE_LIMITS weights by default
+        :return: seconds waited
+        """
+        self.loop = asyncio.get_event_loop()
+        self.in_flight[exchange] = self.in_flight.get(exchange, 0) + 1
+
+        if self.__bucket(exchange) is None and self.__bucket(exchange, endpoint) is None:
+            return 0.0
+
+        priority = self.priority(endpoint) if priority is None else priority
+        weight = self.weight(exchange, endpoint) if weight is None else weight
+        started = self.loop.time()
+        future = self.loop.create_future()
+        self.waiters.setdefault(exchange, []).append((priority, next(self.sequence), endpoint, weight, future))
+        self.__dispatch(exchange)
+
+        try:
+            await future
+        except BaseException:
+            self.release(exchange)
+            raise
+        finally:
+            future.cancel()
+
+        waited = self.loop.time() - started
+
+        if self.metrics is not None:
+            self.metrics.observe('rate_limit_wait_seconds', waited, exchange=exchange, priority=str(priority))
+
+        return waited
+
+    def release(self, exchange: str) -> None:
+        self.in_flight[exchange] -= 1
+
+    def __dispatch(self, exchange: str) -> None:
+        timer = self.timers.pop(exchange, None)
+
+        if timer is not None:
+            timer.cancel()
+
+        now = self.loop.time()
+        exchange_bucket = self.__bucket(exchange)
+        waiters = []
+        wake = None
+        held = False
+
+        for waiter in sorted(self.waiters.get(exchange, ())):
+            priority, _, endpoint, weight, future = waiter
+
+            if future.done():
+                continue
+
+            if held:
+                waiters.append(waiter)
+                continue
+
+            endpoint_bucket = self.__bucket(exchange, endpoint)
+            exchange_wait = exchange_bucket.wait_time(weight, now) if exchange_bucket is not None else 0
+            endpoint_wait = endpoint_bucket.wait_time(weight, now) if endpoint_bucket is not None else 0
+
+            if not exchange_wait and not endpoint_wait:
+                for bucket in (exchange_bucket, endpoint_bucket):
+                    if bucket is not None:
+                        bucket.take(weight)
+
+                future.set_result(None)
+                continue
+
+            waiters.append(waiter)
+            wait = max(exchange_wait, endpoint_wait)
+            wake = wait if wake is None else min(wake, wait)
+            held = exchange_wait > 0
+
+        self.waiters[exchange] = waiters
+
+        if wake is not None:
+            self.timers[exchange] = self.loop.call_later(wake + self.TIMER_MARGIN, self.__dispatch, exchange)
+
+    def update(self, exchange: str, headers: dict, endpoint: str = None, rejected: bool = False) -> None:
+        """
+        Apply rate headers of an exchange response
+
+        :param headers: response headers, RateLimit-Remaining lowers the exchange bucket, Retry-After pauses
+                        the exchange and the endpoint
+        :param endpoint: client method of the response
+        :param rejected: the request was rejected for its rate, pauses the exchange for Config.RATE_LIMIT_PAUSE
+                         if there is no Retry-After
+        """
+        if self.loop is None:
+            return
+
+        headers = headers or {}
+        now = self.loop.time()
+        exchange_bucket = self.__bucket(exchange)
+        endpoint_bucket = self.__bucket(exchange, endpoint)
+        retry_after = headers.get('Retry-After') or headers.get('retry-after')
+        remaining = next((headers[name] for name in self.REMAINING_HEADERS if name in headers), None)
+
+        if rejected:
+            logger.warning(f'{exchange} {endpoint} rejected for rate limit, retry after {retry_after or self.pause}s')
+
+            if self.metrics is not None:
+                self.metrics.inc('rate_limit_rejections_total', exchange=exchange, method=endpoint)
+
+        if remaining is not None and exchange_bucket is not None:
+            # requests still in flight were mostly sent after the one the headers answer and are not counted yet
+            exchange_bucket.refill(now)
+            exchange_bucket.limit(float(remaining) - self.in_flight.get(exchange, 0))
+
+        if retry_after is not None or rejected:
+            for bucket in (exchange_bucket, endpoint_bucket):
+                if bucket is not None:
+                    bucket.refill(now)
+                    bucket.pause(now + float(retry_after or self.pause))
+
+        if self.waiters.get(exchange):
+            self.__dispatch(exchange)
+
+    @classmethod
+    def is_rejection(cls, error: BaseException) -> bool:
+        return getattr(error, 'status', None) in cls.REJECTED
+
+    def listener(self, exchange: str):
+        """
+        :return: client listener applying RATE_LIMIT events, their payload is the response headers
+        """
+        def callback(event_type, payload):
+            if event_type == EventTypeEnum.RATE_LIMIT and self.loop is not None:
+                self.loop.call_soon_threadsafe(self.update, exchange, payload)
+
+        return callback
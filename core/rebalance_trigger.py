@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+
+from config import Config
+from core.enums import ClientsOrderStatuses, EventTypeEnum
+
+logger = logging.getLogger(__name__)
+
+
+class RebalanceTrigger:
+    """
+    Keeps ExposureEngine up to date from client account/order update streams and starts
+    balancing as soon as |disbalance_usd| crosses Config.MIN_DISBALANCE.
+
+    ACCOUNT_UPDATE positions overwrite the exchange's position, fills of ORDER_TRADE_UPDATE move it
+    by the newly filled amount of the order, fills of other tickers of the shared client are skipped.
+    Events without a position or an order side and ticker refresh the position over REST.
+
+    Triggers are debounced and never fire more often than once per min_interval, the periodic
+    balancing task stays in place as a safety sweep.
+    """
+    __slots__ = 'client_pool', 'clients', 'exposure', 'symbol', 'callback', 'debounce', 'min_interval', 'loop', \
+                'last_trigger', 'fills', '_timer', '_refreshing'
+
+    def __init__(self, client_pool, exposure, symbol: str, callback, settings: dict = None):
+        settings = settings or Config.STREAM_TRIGGER
+        self.client_pool = client_pool
+        self.clients = client_pool.for_symbol(symbol)
+        self.exposure = exposure
+        self.symbol = symbol
+        self.callback = callback
+        self.debounce = settings['debounce']
+        self.min_interval = settings['min_interval']
+        self.loop = None
+        self.last_trigger = None
+        self.fills = {}
+        self._timer = None
+        self._refreshing = set()
+
+    @property
+    def net_coin(self) -> float:
+        return self.exposure.net(self.symbol)[0]
+
+    @property
+    def net_usd(self) -> float:
+        return self.exposure.net(self.symbol)[1]
+
+    async def start(self) -> None:
+        self.loop = asyncio.get_event_loop()
+
+        for client_name, client in self.clients.items():
+            client.add_listener(self.__listener(client_name))
+            await self.__refresh(client_name)
+
+        logger.info(f'Stream trigger started, net position: {self.net_coin} coin / {self.net_usd} usd')
+
+    def __listener(self, client_name: str):
+        def callback(event_type, payload):
+            self.loop.call_soon_threadsafe(self.on_event, client_name, event_type, payload)
+
+        return callback
+
+    def on_event(self, client_name: str, event_type: str, payload: dict) -> None:
+        client = self.clients[client_name]
+
+        if event_type == EventTypeEnum.ACCOUNT_UPDATE and client.symbol in payload:
+            self.update_position(client_name, payload[client.symbol])
+
+        elif event_type == EventTypeEnum.ORDER_TRADE_UPDATE and (payload or {}).get('side') \
+                and payload.get('exchange_order_id') and payload.get('symbol') is not None:
+            if payload['symbol'] == client.symbol:
+                self.apply_fill(client_name, payload)
+
+        elif event_type in (EventTypeEnum.ACCOUNT_UPDATE, EventTypeEnum.ORDER_TRADE_UPDATE) \
+                and client_name not in self._refreshing:
+            self._refreshing.add(client_name)
+            self.loop.create_task(self.__refresh(client_name))
+
+    async def __refresh(self, client_name: str) -> None:
+        client = self.clients[client_name]
+
+        try:
+            positions = await self.client_pool.call(client.get_positions, timeout=Config.SNAPSHOT_TIMEOUT)
+            self.update_position(client_name, positions.get(client.symbol, {}))
+        except Exception as e:
+            logger.warning(f'Error {e!r} while refreshing {client_name} position')
+        finally:
+            self._refreshing.discard(client_name)
+
+    def update_position(self, client_name: str, position: dict) -> None:
+        self.exposure.set_position(client_name, self.symbol, position.get('amount', 0), position.get('amount_usd', 0))
+        self.__check()
+
+    def apply_fill(self, client_name: str, order: dict) -> None:
+        """
+        Move the position by the part of the order filled since its last update
+
+        :param order: get_order_by_id format with the order side, amounts are cumulative
+        """
+        key = (client_name, order['exchange_order_id'])
+        amount, amount_usd = float(order.get('factual_amount_coin') or 0), float(order.get('factual_amount_usd') or 0)
+        seen_amount, seen_usd = self.fills.get(key, (0.0, 0.0))
+        sign = 1 if order['side'].lower() == 'buy' else -1
+        self.exposure.apply_delta(client_name, self.symbol,
+                                  sign * (amount - seen_amount), sign * (amount_usd - seen_usd))
+
+        if ClientsOrderStatuses.to_order_status(order.get('status'), amount) is None:
+            self.fills[key] = (amount, amount_usd)
+        else:
+            self.fills.pop(key, None)
+
+        self.__check()
+
+    def __check(self) -> None:
+        if abs(self.net_usd) > Config.MIN_DISBALANCE and self._timer is None:
+            self._timer = self.loop.call_later(self.debounce, self.__fire)
+
+    def __fire(self) -> None:
+        self._timer = None
+
+        if abs(self.net_usd) <= Config.MIN_DISBALANCE:
+            return
+
+        if self.last_trigger is not None and time.monotonic() - self.last_trigger < self.min_interval:
+            wait = self.last_trigger + self.min_interval - time.monotonic()
+            self._timer = self.loop.call_later(wait, self.__fire)
+            return
+
+        self.last_trigger = time.monotonic()
+        logger.info(f'Disbalance {self.net_usd} usd crossed {Config.MIN_DISBALANCE}, trigger balancing')
+        self.loop.create_task(self.__run_callback())
+
+    async def __run_callback(self) -> None:
+        try:
+            await self.callback()
+        except Exception as e:
+            logger.error(f'Error {e!r} in triggered balancing')
+
+    def stop(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import random
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    Periodic job and its lag counters, lag is how late a run started against its scheduled time
+    """
+    __slots__ = 'name', 'interval', 'callback', 'delay', 'jitter', 'runs', 'skipped', 'failed', \
+                'last_lag', 'max_lag', 'total_lag', 'task'
+
+    def __init__(self, name: str, interval: float, callback, delay: float = 0, jitter: float = 0):
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.delay = delay
+        self.jitter = jitter
+        self.runs = 0
+        self.skipped = 0
+        self.failed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.task = None
+
+    def stats(self) -> dict:
+        return {
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'last_lag': round(self.last_lag, 6),
+            'max_lag': round(self.max_lag, 6),
+            'avg_lag': round(self.total_lag / self.runs, 6) if self.runs else 0
+        }
+
+
+class Scheduler:
+    """
+    Runs coroutine callbacks at a fixed cadence on the event loop monotonic clock.
+
+    Run k of a job is due at start + delay + k * interval (plus up to `jitter` seconds), whatever
+    the callbacks took before, so the schedule does not drift. A late run starts at once, runs a
+    slow callback missed entirely are skipped and counted instead of being fired in a burst.
+    """
+    __slots__ = 'jobs',
+
+    def __init__(self):
+        self.jobs = {}
+
+    def add(self, name: str, interval: float, callback, delay: float = 0, jitter: float = 0) -> Job:
+        """
+        :param name: job name, e.g. routing key
+        :param interval: seconds between runs, fractions allowed
+        :param callback: callable without arguments returning a coroutine
+        :param delay: seconds before the first run
+        :param jitter: max random seconds added to every run to spread jobs with one interval
+        :return: Job
+        """
+        job = self.jobs[name] = Job(name, interval, callback, delay, jitter)
+
+        return job
+
+    def start(self) -> None:
+        loop = asyncio.get_event_loop()
+
+        for job in self.jobs.values():
+            if job.task is None or job.task.done():
+                job.task = loop.create_task(self.__run(job))
+
+    async def __run(self, job: Job) -> None:
+        loop = asyncio.get_event_loop()
+        due = loop.time() + job.delay
+
+        while True:
+            fire_at = due + random.uniform(0, job.jitter) if job.jitter else due
+            await asyncio.sleep(max(fire_at - loop.time(), 0))
+
+            lag = loop.time() - fire_at
+            job.runs += 1
+            job.last_lag = lag
+            job.max_lag = max(job.max_lag, lag)
+            job.total_lag += lag
+
+            try:
+                await job.callback()
+
+            except Exception as e:
+                job.failed += 1
+                logger.error(f'Error {e} in scheduled job {job.name}')
+                traceback.print_exc()
+
+            due += job.interval
+            missed = int(max(loop.time() - due, 0) // job.interval)
+
+            if missed:
+                job.skipped += missed
+                due += missed * job.interval
+
+    def stats(self) -> dict:
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    async def stop(self) -> None:
+        tasks = [job.task for job in self.jobs.values() if job.task is not None]
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,105 @@
+import logging
+
+import aiohttp
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPool:
+    """
+    Long-lived aiohttp sessions, one per exchange, each with its own keep-alive connection pool.
+
+    Connection reuse is tracked with aiohttp tracing so pool utilisation can be reported under load.
+    """
+    __slots__ = 'settings', 'overrides', 'sessions', 'counters'
+
+    def __init__(self, settings: dict = None, overrides: dict = None):
+        self.settings = settings or Config.HTTP
+        self.overrides = overrides if overrides is not None else Config.HTTP_EXCHANGES
+        self.sessions = {}
+        self.counters = {}
+
+    def get(self, exchange: str) -> aiohttp.ClientSession:
+        """
+        Shared session for exchange, created on first use inside the running loop
+
+        :param exchange: exchange name as in BaseTask.clients
+        :return: aiohttp.ClientSession
+        """
+        session = self.sessions.get(exchange)
+
+        if session is None or session.closed:
+            session = self.sessions[exchange] = self.__create_session(exchange)
+
+        return session
+
+    def __create_session(self, exchange: str) -> aiohttp.ClientSession:
+        settings = {**self.settings, **self.overrides.get(exchange, {})}
+        connector = aiohttp.TCPConnector(
+            limit=settings['limit'],
+            limit_per_host=settings['limit_per_host'],
+            keepalive_timeout=settings['keepalive_timeout'],
+            ttl_dns_cache=settings['ttl_dns_cache'],
+            use_dns_cache=True
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=settings['total_timeout'],
+            connect=settings['connect_timeout'],
+            sock_read=settings['sock_read_timeout']
+        )
+        self.counters[exchange] = {'requests': 0, 'new_connections': 0, 'reused_connections': 0}
+
+        return aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     trace_configs=[self.__trace_config(self.counters[exchange])])
+
+    @staticmethod
+    def __trace_config(counters: dict) -> aiohttp.TraceConfig:
+        async def on_request_start(session, context, params):
+            counters['requests'] += 1
+
+        async def on_connection_create_end(session, context, params):
+            counters['new_connections'] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            counters['reused_connections'] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+
+        return trace_config
+
+    def stats(self) -> dict:
+        """
+        Pool utilisation per exchange: in-use and idle connections, limits and reuse counters
+        :return: dict
+        """
+        stats = {}
+
+        for exchange, session in self.sessions.items():
+            if session.closed:
+                continue
+
+            connector = session.connector
+            counters = self.counters[exchange]
+            connections = counters['new_connections'] + counters['reused_connections']
+            stats[exchange] = {
+                'in_use': len(connector._acquired),  # noqa
+                'idle': sum(len(conns) for conns in connector._conns.values()),  # noqa
+                'limit': connector.limit,
+                'limit_per_host': connector.limit_per_host,
+                **counters,
+                'reuse_ratio': round(counters['reused_connections'] / connections, 4) if connections else 0
+            }
+
+        return stats
+
+    async def close(self) -> None:
+        for exchange, session in self.sessions.items():
+            if not session.closed:
+                await session.close()
+
+        logger.info('HTTP sessions closed')
@@ -0,0 +1,73 @@
+import numpy as np
+
+from config import Config
+
+
+class ShiftEstimator:
+    """
+    Online estimate of exchange price shifts.
+
+    Keeps an exponentially weighted mean of the pairwise deviations (p_i - p_j) / p_j used by
+    tools.shifts.Shifts, so every tick costs one E x E update regardless of history length. The
+    shift of an exchange is its mean deviation from all other exchanges.
+    """
+    __slots__ = 'alpha', 'min_ticks', 'exchanges', 'deviations', 'counts'
+
+    def __init__(self, exchanges: list = (), settings: dict = None):
+        settings = settings or Config.SHIFT_ESTIMATOR
+        self.alpha = 1 - 0.5 ** (1 / settings['halflife'])
+        self.min_ticks = settings['min_ticks']
+        self.exchanges = {}
+        self.deviations = np.zeros((0, 0))
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+
+        for exchange in exchanges:
+            self.__exchange_index(exchange)
+
+    def __exchange_index(self, exchange: str) -> int:
+        index = self.exchanges.get(exchange)
+
+        if index is None:
+            index = self.exchanges[exchange] = len(self.exchanges)
+            self.deviations = np.pad(self.deviations, ((0, 1), (0, 1)))
+            self.counts = np.pad(self.counts, ((0, 1), (0, 1)))
+
+        return index
+
+    def update(self, prices: dict) -> None:
+        """
+        :param prices: exchange -> price sampled at the same moment, e.g. snapshot mid prices
+        """
+        indexes = [self.__exchange_index(exchange) for exchange in prices]
+        values = np.fromiter(prices.values(), dtype=np.float64, count=len(prices))
+        deviations = values[:, None] / values[None, :] - 1
+        full = indexes == list(range(len(self.exchanges)))
+        pair = (slice(None), slice(None)) if full else np.ix_(indexes, indexes)
+        alpha = np.where(self.counts[pair] > 0, self.alpha, 1.0)
+        self.deviations[pair] += alpha * (deviations - self.deviations[pair])
+        self.counts[pair] += 1
+
+    def pairwise(self) -> dict:
+        """
+        :return: 'A B' -> current deviation of A from B, key format of tools.shifts.Shifts
+        """
+        return {f'{name_1} {name_2}': float(self.deviations[i, j])
+                for name_1, i in self.exchanges.items() for name_2, j in self.exchanges.items()
+                if i != j and self.counts[i, j]}
+
+    def shifts(self) -> dict:
+        """
+        :return: exchange -> shift for exchanges with at least min_ticks samples
+        """
+        known = self.counts >= self.min_ticks
+        np.fill_diagonal(known, False)
+        others = known.sum(axis=1)
+        means = np.where(known, self.deviations, 0).sum(axis=1) / np.maximum(others, 1)
+
+        return {exchange: float(means[i]) for exchange, i in self.exchanges.items() if others[i]}
+
+    def current(self, defaults: dict) -> dict:
+        """
+        Estimated shifts where available, defaults (Config.SHIFTS) for the rest
+        """
+        return {**defaults, **self.shifts()}
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+from types import MappingProxyType
+from typing import NamedTuple
+
+import numpy as np
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class BookTop:
+    """
+    Best N levels of an orderbook as (price, size) float64 arrays with the time they refer to
+    """
+    __slots__ = 'asks', 'bids', 'ts'
+
+    def __init__(self, asks: np.ndarray, bids: np.ndarray, ts: float):
+        self.asks = asks
+        self.bids = bids
+        self.ts = ts
+
+    @classmethod
+    def from_orderbook(cls, orderbook: dict, depth: int, received_at: float) -> 'BookTop':
+        """
+        :param orderbook: client orderbook for one symbol, {'asks': [[price, size], ...], 'bids': ..., 'timestamp': ...}
+        :param depth: number of levels to keep per side
+        :param received_at: local time of the read, used when the book has no timestamp
+        :return: BookTop
+        """
+        ts = orderbook.get('timestamp')
+
+        if not isinstance(ts, (int, float)) or not ts:
+            ts = received_at
+        elif ts > 1e11:
+            ts /= 1000
+
+        return cls(asks=cls.__levels(orderbook['asks'], depth), bids=cls.__levels(orderbook['bids'], depth), ts=ts)
+
+    @staticmethod
+    def __levels(levels: list, depth: int) -> np.ndarray:
+        array = np.empty((min(len(levels), depth), 2), dtype=np.float64)
+
+        for i, level in enumerate(levels[:depth]):
+            array[i, 0], array[i, 1] = level[0], level[1]
+
+        return array
+
+    @property
+    def best_ask(self) -> float:
+        return float(self.asks[0, 0])
+
+    @property
+    def best_bid(self) -> float:
+        return float(self.bids[0, 0])
+
+    @property
+    def mid(self) -> float:
+        return (self.best_ask + self.best_bid) / 2
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.ts
+
+
+class MarketSnapshot(NamedTuple):
+    """
+    Immutable per-cycle view of every exchange taken at the same moment
+    """
+    ts: float
+    positions: MappingProxyType
+    books: MappingProxyType
+    balances: MappingProxyType
+    errors: MappingProxyType
+
+    @property
+    def complete(self) -> bool:
+        return not self.errors
+
+    def stale(self, max_age: float) -> dict:
+        """
+        :param max_age: max allowed book age in seconds
+        :return: exchange -> age for books older than max_age
+        """
+        ages = {name: book.age for name, book in self.books.items()}
+
+        return {name: age for name, age in ages.items() if age > max_age}
+
+
+async def cancel_all_orders(client_pool, timeout: float, clients: dict = None) -> dict:
+    """
+    Cancel open orders on every exchange in parallel
+
+    :param client_pool: core.client_pool.ClientPool
+    :param timeout: per-exchange deadline in seconds
+    :param clients: exchange name -> client, client_pool.clients by default
+    :return: exchange -> error for failed cancels
+    """
+    clients = client_pool.clients if clients is None else clients
+    results = await asyncio.gather(*[
+        client_pool.call(client.cancel_all_orders, timeout=timeout) for client in clients.values()
+    ], return_exceptions=True)
+
+    return {name: repr(result) for name, result in zip(clients, results) if isinstance(result, BaseException)}
+
+
+async def take_snapshot(client_pool, timeout: float, depth: int = None, clients: dict = None) -> MarketSnapshot:
+    """
+    Read positions, orderbooks and real balances of all exchanges in parallel, exactly once per cycle
+
+    :param client_pool: core.client_pool.ClientPool
+    :param timeout: per-exchange deadline in seconds
+    :param depth: orderbook levels kept per side, Config.BOOK_DEPTH by default
+    :param clients: exchange name -> client, client_pool.clients by default
+    :return: MarketSnapshot, exchanges that missed the deadline are listed in errors
+    """
+    depth = Config.BOOK_DEPTH if depth is None else depth
+    clients = client_pool.clients if clients is None else clients
+    results = await asyncio.gather(*[
+        asyncio.wait_for(_read_exchange(client_pool, client, depth), timeout) for client in clients.values()
+    ], return_exceptions=True)
+
+    positions, books, balances, errors = {}, {}, {}, {}
+
+    for name, result in zip(clients, results):
+        if isinstance(result, BaseException):
+            logger.warning(f'Snapshot of {name} failed: {result!r}')
+            errors[name] = repr(result)
+            continue
+
+        positions[name], books[name], balances[name] = result
+
+    return MarketSnapshot(ts=time.time(),
+                          positions=MappingProxyType(positions),
+                          books=MappingProxyType(books),
+                          balances=MappingProxyType(balances),
+                          errors=MappingProxyType(errors))
+
+
+async def _read_exchange(client_pool, client, depth: int) -> tuple:
+    all_positions, balance = await asyncio.gather(
+        client_pool.call(client.get_positions),
+        client_pool.call(client.get_real_balance)
+    )
+    book = BookTop.from_orderbook(client.get_orderbook()[client.symbol], depth, time.time())
+
+    return all_positions.get(client.symbol, {}), book, balance
@@ -1,45 +1,56 @@
 import asyncio
+import functools
 import logging
 
-import orjson
-from aio_pika import connect, ExchangeType, Message
+from aio_pika import connect_robust
 
 from config import Config
+from core.publisher import Publisher
+from core.scheduler import Scheduler
 
 logger = logging.getLogger(__name__)
 
 
 class WorkerProducer:
+    """
+    Publishes PERIODIC_TASKS messages at a fixed cadence over one robust connection
+    """
+
     def __init__(self, loop):
         self.loop = loop
         self.rabbit_url = f"amqp://{Config.RABBIT['username']}:{Config.RABBIT['password']}@{Config.RABBIT['host']}:{Config.RABBIT['port']}/"
-        self.periodic_tasks = []
+        self.connection = None
+        self.publisher = None
+        self.scheduler = Scheduler()
 
     async def run(self):
-        for task in Config.PERIODIC_TASKS:
-            self.periodic_tasks.append(self.loop.create_task(self._publishing_task(task)))
+        self.connection = await connect_robust(url=self.rabbit_url, loop=self.loop)
+        self.publisher = Publisher(self.connection)
 
-    async def _publishing_task(self, task):
-        if task['delay']:
-            await asyncio.sleep(task['delay'])
+        for task in Config.PERIODIC_TASKS:
+            self.scheduler.add(task['routing_key'], task['interval'], functools.partial(self._publish, task),
+                               delay=task['delay'], jitter=task.get('jitter', 0))
 
-        while True:
-            connection = await connect(url=self.rabbit_url, loop=self.loop)
+        self.scheduler.add('producer.stats', Config.PRODUCER_STATS_INTERVAL, self._log_stats,
+                           delay=Config.PRODUCER_STATS_INTERVAL)
+        self.scheduler.start()
 
-            channel = await connection.channel()
+    async def _publish(self, task):
+        await self.publisher.publish(task.get('payload') or {}, task['routing_key'], task['exchange'], task['queue'])
 
-            exchange = await channel.declare_exchange(task['exchange'], type=ExchangeType.DIRECT, durable=True)
-            queue = await channel.declare_queue(task['queue'], durable=True)
-            await queue.bind(exchange, routing_key=task['routing_key'])
+        logger.info(f'Published message to queue {task["queue"]}')
 
-            message = Message(orjson.dumps(task['payload']) if task.get('payload') else b'{}')
-            await exchange.publish(message, routing_key=task['routing_key'])
+    async def _log_stats(self):
+        logger.info(f'Publish lag: {self.scheduler.stats()}')
 
-            logger.info(f'Published message to queue {task["queue"]}')
+    async def stop(self):
+        await self.scheduler.stop()
 
-            await connection.close()
+        if self.publisher is not None:
+            await self.publisher.close()
 
-            await asyncio.sleep(task['interval'])
+        if self.connection is not None:
+            await self.connection.close()
 
 
 if __name__ == '__main__':
@@ -51,4 +62,5 @@ if __name__ == '__main__':
     try:
         loop.run_forever()
     finally:
+        loop.run_until_complete(worker.stop())
         loop.close()
@@ -1,39 +1,19 @@
-import asyncio
-
-import aiohttp
-
 from core.base_task import BaseTask
-from core.enums import RabbitMqQueues
+from core.order_fetcher import OrderResultsFetcher
 
 
 class GetOrdersResults(BaseTask):
-    __slots__ = 'app', 'clients', 'order_result'
+    __slots__ = 'app', 'clients', 'fetcher'
 
     def __init__(self, app):
-        super().__init__()
+        super().__init__(app)
         self.app = app
-        self.order_result = {}
-
-    async def run(self, payload) -> None:
-        print('START')
-        await self.__check_all_orders(payload)
-        await self.__send_to_save_orders_results()
 
+        if app.get('order_fetcher') is None:
+            app['order_fetcher'] = OrderResultsFetcher(self.client_pool, self.sessions, self.publisher)
 
-    async def __check_all_orders(self, payload: dict) -> None:
-        try:
-            async with aiohttp.ClientSession() as session:
-                self.order_result = await self.clients[payload['exchange']].get_order_by_id(payload['order_ids'], session)
-                print(f'{self.order_result=}')
+        self.fetcher = app['order_fetcher']
 
-        except aiohttp.ServerDisconnectedError:
-            await self.__check_all_orders(payload)
-
-    async def __send_to_save_orders_results(self):
-        if self.order_result:
-
-            await self.publish_message(connect=self.app['mq'],
-                                       message=self.order_result,
-                                       routing_key=RabbitMqQueues.UPDATE_ORDERS,
-                                       exchange_name=RabbitMqQueues.get_exchange_name(RabbitMqQueues.UPDATE_ORDERS),
-                                       queue_name=RabbitMqQueues.UPDATE_ORDERS)
+    async def run(self, payload) -> None:
+        print('START')
+        await self.fetcher.submit(payload['exchange'], payload['order_ids'], payload.get('symbol'))
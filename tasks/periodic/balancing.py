@@ -3,42 +3,63 @@ import time
 import datetime
 import uuid
 
-import aiohttp
-
 from config import Config
+from core.allocation import Allocation, allocate
 from core.base_task import BaseTask
 from core.enums import PositionSideEnum, RabbitMqQueues
+from core.messages import BalanceDetalizationRecord, DisbalanceRecord, OrderRecord
+from core.order_tracker import OrderTracker
+from core.shift_estimator import ShiftEstimator
+from core.snapshot import BookTop, cancel_all_orders, take_snapshot
 
 
 class Balancing(BaseTask):
     __slots__ = 'clients', 'positions', 'total_position', 'disbalance_coin', \
                 'disbalance_usd', 'side', 'mq', 'session', 'open_orders', 'app', \
-                'chat_id', 'telegram_bot', 'env', 'disbalance_id', 'average_price'  # noqa
+                'chat_id', 'telegram_bot', 'env', 'disbalance_id', 'average_price', 'snapshot', 'symbol', 'shift_estimator', 'order_tracker'  # noqa
 
-    def __init__(self, app):
-        super().__init__()
+    def __init__(self, app, symbol: str = None):
+        super().__init__(app, symbol)
         self.app = app
-        self.__set_default()
+        self.symbol = symbol if symbol is not None else next(iter(self.client_pool.markets))
+
+        if app.get('shifts') is None:
+            app['shifts'] = {}
+
+        if self.symbol not in app['shifts']:
+            app['shifts'][self.symbol] = ShiftEstimator(list(self.clients))
+
+        self.shift_estimator = app['shifts'][self.symbol]
 
-        for client in self.clients:
-            self.clients[client].run_updater()
+        if app.get('order_tracker') is None:
+            app['order_tracker'] = OrderTracker(self.client_pool, self.sessions, self.outbox, metrics=self.metrics)
+
+        self.order_tracker = app['order_tracker']
+        self.__set_default()
 
         self.chat_id = Config.TELEGRAM_CHAT_ID
         self.telegram_bot = Config.TELEGRAM_TOKEN
         self.env = Config.ENV
         self.disbalance_id = 0  # noqa
 
-        time.sleep(15)
-
     async def run(self, payload: dict) -> None:
-        print('START BALANCING')
-        async with aiohttp.ClientSession() as session:
-            await self.__close_all_open_orders()
-            await self.__get_positions()
-            await self.__get_total_positions()
-            await self.__balancing_positions(session)
+        print(f'START BALANCING {self.symbol}')
+        await self.client_pool.wait_ready()
 
-            self.__set_default()
+        with self.__phase('cycle'):
+            if await self.__take_snapshot():
+                with self.__phase('aggregate'):
+                    await self.__get_total_positions()
+
+                await self.__balancing_positions()
+
+        self.__set_default()
+
+    def __phase(self, phase: str):
+        return self.metrics.timer('balancing_phase_seconds', symbol=self.symbol, phase=phase)
+
+    def __skip(self, reason: str) -> None:
+        self.metrics.inc('balancing_skipped_cycles_total', symbol=self.symbol, reason=reason)
 
     def __set_default(self) -> None:
         self.positions = {}
@@ -47,69 +68,263 @@ class Balancing(BaseTask):
         self.disbalance_coin = 0  # noqa
         self.disbalance_usd = 0  # noqa
         self.side = 'LONG'
+        self.snapshot = None
 
-    async def __get_positions(self) -> None:
-        prices = []
-        for client_name, client in self.clients.items():
-            self.positions[client.EXCHANGE_NAME] = client.get_positions().get(client.symbol, {})
-            orderbook = client.get_orderbook()[client.symbol]
-            prices.append((orderbook['asks'][0][0] + orderbook['bids'][0][0]) / 2)
+    async def __take_snapshot(self) -> bool:
+        with self.__phase('cancel'):
+            cancel_errors = await cancel_all_orders(self.client_pool, Config.SNAPSHOT_TIMEOUT, self.clients)
 
-        self.average_price = sum(prices) / len(prices)
-        print(f'{self.positions=}')
+        if cancel_errors:
+            print(f'CANCEL FAILED, SKIP CYCLE: {cancel_errors}')
+            self.__skip('cancel_failed')
+            return False
 
-    async def __get_total_positions(self) -> None:
-        positions = {'long': {'coin': 0, 'usd': 0}, 'short': {'coin': 0, 'usd': 0}}
+        with self.__phase('snapshot'):
+            self.snapshot = await take_snapshot(self.client_pool, Config.SNAPSHOT_TIMEOUT, clients=self.clients)
 
-        for ecx_name, position in self.positions.items():
-            if position and position.get('side') == PositionSideEnum.LONG:
-                positions['long']['coin'] += position['amount']
-                positions['long']['usd'] += position['amount_usd']
-            elif position and position.get('side') == PositionSideEnum.SHORT:
-                positions['short']['coin'] += position['amount']
-                positions['short']['usd'] += position['amount_usd']
+        if not self.snapshot.complete:
+            print(f'SNAPSHOT INCOMPLETE, SKIP CYCLE: {dict(self.snapshot.errors)}')
+            self.__skip('snapshot_incomplete')
+            return False
 
-        self.disbalance_coin = positions['long']['coin'] + positions['short']['coin']  # noqa
-        self.disbalance_usd = positions['long']['usd'] + positions['short']['usd']  # noqa
+        self.positions = dict(self.snapshot.positions)
+        prices = {client_name: book.mid for client_name, book in self.snapshot.books.items()}
+        self.average_price = sum(prices.values()) / len(prices)
+        self.shift_estimator.update(prices)
+        print(f'{self.positions=}')
 
-    async def __close_all_open_orders(self) -> None:
-        for _, client in self.clients.items():
-            client.cancel_all_orders()
+        return True
 
-    async def __balancing_positions(self, session) -> None:
-        tasks = []
-        tasks_data = {}
-        amount = abs(self.disbalance_coin) / len(self.clients)
+    async def __get_total_positions(self) -> None:
+        for client_name, position in self.positions.items():
+            if position and position.get('side') in (PositionSideEnum.LONG, PositionSideEnum.SHORT):
+                self.exposure.set_position(client_name, self.symbol,
+                                           position['amount'], position['amount_usd'])
+            else:
+                self.exposure.set_position(client_name, self.symbol, 0, 0)
+
+        # positions read over REST, drop the float error of fills applied as deltas in between
+        self.exposure.recalculate()
+        self.disbalance_coin, self.disbalance_usd = self.exposure.net(self.symbol)  # noqa
 
+    async def __balancing_positions(self) -> None:
         if abs(self.disbalance_usd) > Config.MIN_DISBALANCE:
             self.side = 'sell' if self.disbalance_usd > 0 else 'buy'
             self.disbalance_id = uuid.uuid4()  # noqa
 
             print('FOUND DISBALANCE')
-            for client_name, client in self.clients.items():
-                await self.save_balance_detalization(client, 'pre-balancing')
-                ask_or_bid = 'bids' if self.side == 'LONG' else 'asks'
-                price = client.get_orderbook().get(client.symbol, {}).get(ask_or_bid)[0][0]  # noqa
-                tasks.append(client.create_order(amount=amount, side=self.side, price=price, session=session))
-                tasks_data.update({client_name: {'price': price, 'order_place_time':  time.time()}})
-
-            await self.__place_and_save_orders(tasks, tasks_data, amount)
+            self.metrics.inc('balancing_disbalances_total', symbol=self.symbol)
+            stale = self.snapshot.stale(Config.MAX_BOOK_AGE)
+
+            if stale:
+                print(f'STALE MARKET DATA, SKIP BALANCING: {stale}')
+                self.__skip('stale_market_data')
+                return
+
+            for client_name in self.clients:
+                await self.save_balance_detalization(client_name, 'pre-balancing')
+
+            with self.__phase('allocate'):
+                allocation = await self.__allocate(abs(self.disbalance_coin))
+
+            print(f'{allocation=}')
+            orders = await self.__place(allocation)
             await self.save_disbalance()
 
-    async def __place_and_save_orders(self, tasks, tasks_data, amount) -> None:
-        for res in await asyncio.gather(*tasks, return_exceptions=True):
-            exchange = res['exchange_name']
-            order_place_time = res['timestamp'] - tasks_data[exchange]['order_place_time']
-            await self.save_orders(self.clients[exchange], tasks_data[exchange]['price'], amount, order_place_time)
+            if Config.EXECUTION['mode'] == 'adaptive':
+                with self.__phase('execute'):
+                    await self.__execute(orders, Config.EXECUTION)
+
+    async def __place(self, allocation: Allocation, slippage: float = 0.0) -> list:
+        """
+        :param slippage: relative price cushion crossing the allocated limit prices deeper
+        :return: placed orders as (client, exchange order id, future of the final OrderUpdateRecord)
+        """
+        tasks = []
+        tasks_data = {}
+
+        for client_name, amount in allocation.amounts.items():
+            price = allocation.prices[client_name] * (1 + slippage if self.side == 'buy' else 1 - slippage)
+            tasks.append(self.__create_order(client_name, amount, price))
+            tasks_data.update({client_name: {'price': price, 'amount': amount, 'order_place_time': time.time()}})
+
+        return await self.__place_and_save_orders(tasks, tasks_data)
+
+    async def __execute(self, orders: list, settings: dict) -> None:
+        """
+        Chase the unfilled part of the hedge within the time budget.
+
+        Every reprice_interval, or as soon as all orders are final, open orders are cancelled and once their
+        final fills are known the residual is allocated again on the cached books that are fresh and two-sided,
+        aggressive_after of the budget later the limits cross max_slippage deeper. Stops when the residual is
+        below MIN_DISBALANCE, orders left open then are cancelled.
+        """
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        deadline = started + settings['budget']
+        target = abs(self.disbalance_coin)
+
+        while True:
+            pending = [done for _, _, done in orders if not done.done()]
+            timeout = min(settings['reprice_interval'], deadline - loop.time())
+
+            if pending and timeout > 0:
+                await asyncio.wait(pending, timeout=timeout)
+
+            residual = target - self.__filled(orders)
+
+            if residual * self.average_price < Config.MIN_DISBALANCE:
+                print(f'HEDGE FILLED, RESIDUAL {residual} COIN')
+                self.metrics.observe('balancing_time_to_flat_seconds', loop.time() - started, symbol=self.symbol)
+                break
+
+            if loop.time() >= deadline:
+                print(f'EXECUTION BUDGET SPENT, RESIDUAL {residual} COIN')
+                self.__skip('execution_budget_spent')
+                break
+
+            if not await self.__cancel_open(orders, settings['cancel_timeout']):
+                continue
 
-    async def save_orders(self, client, expect_price, amount, order_place_time) -> None:
-        message = {
+            residual = target - self.__filled(orders)
+
+            if residual * self.average_price < Config.MIN_DISBALANCE:
+                continue
+
+            books = self.__requote()
+
+            if not books:
+                print('NO FRESH BOOKS TO REPRICE ON')
+                await asyncio.sleep(max(min(settings['reprice_interval'], deadline - loop.time()), 0))
+                continue
+
+            allocation = await self.__allocate(residual, books)
+            aggressive = loop.time() - started >= settings['aggressive_after'] * settings['budget']
+            print(f'REPRICE {residual} COIN{" AGGRESSIVE" if aggressive else ""}: {allocation=}')
+            self.metrics.inc('balancing_reprices_total', symbol=self.symbol, aggressive=str(aggressive).lower())
+            placed = await self.__place(allocation, settings['max_slippage'] if aggressive else 0.0)
+            orders += placed
+
+            if not placed:
+                await asyncio.sleep(max(min(settings['reprice_interval'], deadline - loop.time()), 0))
+
+        await self.__cancel_open(orders, settings['cancel_timeout'])
+
+    def __requote(self) -> dict:
+        """
+        :return: exchange -> BookTop of the cached books, books older than Config.MAX_BOOK_AGE or with an empty
+                 side are left out
+        """
+        books = {}
+
+        for client_name, client in self.clients.items():
+            orderbook = client.get_orderbook().get(client.symbol) or {}
+
+            if not orderbook.get('asks') or not orderbook.get('bids'):
+                print(f'EMPTY {client_name} BOOK, SKIP IT IN REPRICE')
+                continue
+
+            book = BookTop.from_orderbook(orderbook, Config.BOOK_DEPTH, time.time())
+
+            if book.age > Config.MAX_BOOK_AGE:
+                print(f'STALE {client_name} BOOK ({book.age:.1f}s), SKIP IT IN REPRICE')
+                continue
+
+            books[client_name] = book
+
+        return books
+
+    def __filled(self, orders: list) -> float:
+        return sum(done.result()['factual_amount_coin'] if done.done() else self.order_tracker.filled(client, order_id)
+                   for client, order_id, done in orders)
+
+    async def __cancel_open(self, orders: list, timeout: float) -> bool:
+        """
+        Cancel open orders and wait for their final status
+
+        :return: True if no order is left open
+        """
+        open_orders = [(client, order_id, done) for client, order_id, done in orders if not done.done()]
+
+        if not open_orders:
+            return True
+
+        results = await asyncio.gather(*[
+            self.client_pool.call(client.cancel_all_orders, order_id, timeout=Config.SNAPSHOT_TIMEOUT)
+            for client, order_id, _ in open_orders
+        ], return_exceptions=True)
+
+        for (client, order_id, _), result in zip(open_orders, results):
+            if isinstance(result, BaseException):
+                print(f'CANCEL OF {client.EXCHANGE_NAME} ORDER {order_id} FAILED: {result!r}')
+
+            self.order_tracker.refresh(client)
+
+        _, pending = await asyncio.wait([done for _, _, done in open_orders], timeout=timeout)
+
+        return not pending
+
+    async def __allocate(self, amount: float, books: dict = None) -> Allocation:
+        books = self.snapshot.books if books is None else books
+        available = await asyncio.gather(*[
+            self.client_pool.call(self.clients[client_name].get_available_balance, self.side,
+                                  timeout=Config.SNAPSHOT_TIMEOUT)
+            for client_name in books
+        ], return_exceptions=True)
+        capacities = {
+            client_name: 0 if isinstance(balance, BaseException) else balance / books[client_name].mid
+            for client_name, balance in zip(books, available)
+        }
+        levels = {client_name: book.bids if self.side == 'sell' else book.asks for client_name, book in books.items()}
+        fees = {client_name: client.taker_fee for client_name, client in self.clients.items()}
+
+        shifts = self.shift_estimator.current(Config.SHIFTS)
+
+        return await self.run_in_worker(allocate, levels, amount, self.side, fees, shifts, capacities)
+
+    async def __create_order(self, client_name: str, amount: float, price: float) -> dict:
+        client = self.clients[client_name]
+        response = await self.client_pool.call(client.create_order, amount=amount, side=self.side, price=price,
+                                               session=self.sessions.get(client_name))
+
+        if not response.get('exchange_order_id'):
+            raise ValueError(f'{client_name} create_order response has no exchange_order_id: {response}')
+
+        return response
+
+    async def __place_and_save_orders(self, tasks, tasks_data) -> list:
+        orders = []
+
+        with self.__phase('place'):
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        with self.__phase('publish'):
+            for client_name, res in zip(tasks_data, results):
+                if isinstance(res, BaseException):
+                    print(f'ORDER FAILED: {res!r}')
+                    self.metrics.inc('balancing_order_errors_total', symbol=self.symbol, exchange=client_name)
+                    continue
+
+                exchange = res['exchange_name']
+                self.metrics.inc('balancing_orders_total', symbol=self.symbol, exchange=exchange)
+                order_place_time = res['timestamp'] - tasks_data[exchange]['order_place_time']
+                record_id = await self.save_orders(self.clients[exchange], res['exchange_order_id'],
+                                                   tasks_data[exchange]['price'], tasks_data[exchange]['amount'],
+                                                   order_place_time)
+                done = await self.order_tracker.track(self.clients[exchange], res['exchange_order_id'], record_id,
+                                                      tasks_data[exchange]['amount'], res)
+                orders.append((self.clients[exchange], res['exchange_order_id'], done))
+
+        return orders
+
+    async def save_orders(self, client, exchange_order_id, expect_price, amount, order_place_time) -> uuid.UUID:
+        message: OrderRecord = {
             'id': uuid.uuid4(),
             'datetime': datetime.datetime.utcnow(),
             'ts': time.time(),
             'context': 'balancing',
             'parent_id': self.disbalance_id,
-            'exchange_order_id': client.LAST_ORDER_ID,
+            'exchange_order_id': exchange_order_id,
             'type': 'GTT' if client.EXCHANGE_NAME == 'DYDX' else 'GTC',
             'status': 'Processing',
             'exchange': client.EXCHANGE_NAME,
@@ -126,17 +341,15 @@ class Balancing(BaseTask):
             'order_place_time': order_place_time,
             'env': self.env
         }
-        await self.publish_message(connect=self.app['mq'],
-                                   message=message,
-                                   routing_key=RabbitMqQueues.ORDERS,
-                                   exchange_name=RabbitMqQueues.get_exchange_name(RabbitMqQueues.ORDERS),
-                                   queue_name=RabbitMqQueues.ORDERS)
-
-    async def save_balance_detalization(self, client, context):  # noqa
-        client_position_by_symbol = client.get_positions()[client.symbol]
-        mark_price = (client.get_orderbook()[client.symbol]['asks'][0][0] +
-                      client.get_orderbook()[client.symbol]['bids'][0][0]) / 2
-        message = {
+        await self.outbox.put(message, RabbitMqQueues.ORDERS)
+
+        return message['id']
+
+    async def save_balance_detalization(self, client_name, context):  # noqa
+        client = self.clients[client_name]
+        client_position_by_symbol = self.snapshot.positions[client_name]
+        mark_price = self.snapshot.books[client_name].mid
+        message: BalanceDetalizationRecord = {
             'id': uuid.uuid4(),
             'datetime': datetime.datetime.utcnow(),
             'ts': time.time(),
@@ -145,34 +358,27 @@ class Balancing(BaseTask):
             'exchange': client.EXCHANGE_NAME,
             'symbol': client.symbol,
             'max_margin': client.leverage,
-            'current_margin': abs(client_position_by_symbol.get('amount', 0) * mark_price / client.get_real_balance()),
+            'current_margin': abs(client_position_by_symbol.get('amount', 0) * mark_price /
+                               self.snapshot.balances[client_name]),
             'position_coin': client_position_by_symbol.get('amount', 0),
             'position_usd': client_position_by_symbol.get('amount_usd', 0),
             'entry_price': client_position_by_symbol.get('entry_price', 0),
             'mark_price': mark_price
         }
-        await self.publish_message(connect=self.app['mq'],
-                                   message=message,
-                                   routing_key=RabbitMqQueues.BALANCE_DETALIZATION,
-                                   exchange_name=RabbitMqQueues.get_exchange_name(RabbitMqQueues.BALANCE_DETALIZATION),
-                                   queue_name=RabbitMqQueues.BALANCE_DETALIZATION)
+        await self.outbox.put(message, RabbitMqQueues.BALANCE_DETALIZATION)
 
     async def save_disbalance(self):
-        message = {
+        message: DisbalanceRecord = {
             'id': self.disbalance_id,
             'datetime': datetime.datetime.utcnow(),
             'ts': time.time(),
-            'coin_name': self.clients['BINANCE'].symbol,
+            'coin_name': self.symbol,
             'position_coin': self.disbalance_coin,
             'position_usd': self.disbalance_usd,
             'price': self.average_price
         }
 
-        await self.publish_message(connect=self.app['mq'],
-                                   message=message,
-                                   routing_key=RabbitMqQueues.DISBALANCE,
-                                   exchange_name=RabbitMqQueues.get_exchange_name(RabbitMqQueues.DISBALANCE),
-                                   queue_name=RabbitMqQueues.DISBALANCE)
+        await self.outbox.put(message, RabbitMqQueues.DISBALANCE)
 
 
 if __name__ == '__main__':
@@ -1,56 +1,179 @@
-import traceback
+import numpy as np
+
+CHUNK_SIZE = 1 << 22
+
+
+def iter_record_chunks(path: str, offset: int = 0, chunk_size: int = CHUNK_SIZE):
+    """
+    Read complete records of a rates.txt-like file in chunks
+
+    :param path: file path
+    :param offset: byte offset to start from
+    :param chunk_size: bytes per read
+    :return: generator of (offset after the chunk, chunk text)
+    """
+    pending = b''
+
+    with open(path, 'rb') as file:
+        file.seek(offset)
+
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            data = pending + chunk
+            end = data.rfind(b'\n\n')
+
+            if end == -1:
+                pending = data
+                continue
+
+            pending = data[end + 2:]
+            offset += end + 2
+            yield offset, data[:end].decode()
+
+
+def parse_records(text: str) -> tuple:
+    """
+    Parse 'name | price' lines of blank line separated records
+
+    :param text: complete records
+    :return: (record index of every line from 0, exchange names, float64 prices)
+    """
+    lines = text.split('\n')
+    empty = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines)) == 0
+    rows = np.cumsum(empty)[~empty]
+    lines = list(filter(None, lines))
+    parts = ' | '.join(lines).split(' | ')
+
+    if len(parts) != 2 * len(lines):
+        valid = [' | ' in line for line in lines]
+        rows = rows[np.asarray(valid, dtype=bool)]
+        parts = ' | '.join(line for line, ok in zip(lines, valid) if ok).split(' | ')
+
+    names, prices = parts[0::2], parts[1::2]
+    rows = np.unique(rows, return_inverse=True)[1]
+
+    return rows, names, np.fromstring(' '.join(prices), dtype=np.float64, sep=' ')
 
 
 class Shifts:
+    """
+    Mean pairwise price deviations between exchanges over the last `window` records of rates.txt.
 
-    def __init__(self):
-        with open('rates.txt', 'r') as file:
-            data = file.read().split('\n\n')
+    The file ('name | price' lines, records separated by a blank line) is parsed in chunks into a
+    forward-filled (time x exchange) price matrix kept in a fixed-size ring buffer. Deviation sums
+    are updated with broadcasting as records enter and leave the window, so update() only parses
+    lines appended since the previous call and memory does not grow with the file.
+    """
+    CHUNK_SIZE = CHUNK_SIZE
+    BLOCK_RECORDS = 8192
 
-        self.data = data[-300000:]
-        self.list_len = len(data)
-        self.price_deviations = []
-        self.prices = {}
+    def __init__(self, path: str = 'rates.txt', window: int = 300000):
+        """
+        :param path: rates.txt path, None for records pushed from other sources (tools.tick_store)
+        :param window: number of latest records the shifts are averaged over
+        """
+        self.path = path
+        self.window = window
+        self.exchanges = {}
+        self.last_prices = np.zeros(0)
+        self.ring = np.full((window, 0), np.nan)
+        self.sums = np.zeros((0, 0))
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+        self.records = 0
+        self.offset = 0
 
-    def find_deviations(self):
-        for record in self.data:
-            for exchange in record.split('\n'):
-                if exchange == '':
-                    continue
-                name = exchange.split(' | ')[0]
-                price = float(exchange.split(' | ')[1])
-                self.prices.update({name: price})
-
-            # avr_price = sum([x for x in self.prices.values()]) / len(self.prices.values())
-            new_record = {}
-            for name_1 in self.prices.keys():
-                for name_2 in self.prices.keys():
-                    if name_2 == name_1:
-                        continue
-                    # if new_record.get(name_2 + ' ' + name_1):
-                    #     continue
-                    deviation_value = (self.prices[name_1] - self.prices[name_2]) / self.prices[name_2]
-                    # print(f'{exchange}: {deviation_value}')
-                    new_record.update({name_1 + ' ' + name_2: deviation_value})
-            self.price_deviations.append(new_record)
-
-    def get_shifts(self):
-        self.find_deviations()
-        gathering_time = self.list_len / 240
+    def update(self) -> int:
+        """
+        Parse complete records appended to the file since the previous call
+
+        :return: number of new records
+        """
+        new_records = 0
+
+        if self.path is None:
+            return new_records
+
+        for offset, text in iter_record_chunks(self.path, self.offset, self.CHUNK_SIZE):
+            rows, names, prices = parse_records(text)
+            new_records += self.push(names, rows, prices)
+            self.offset = offset
+
+        return new_records
+
+    def find_deviations(self) -> None:
+        self.update()
+
+    def push(self, names: list, rows: np.ndarray, prices: np.ndarray) -> int:
+        """
+        Add records given as ticks: record index, exchange name and price of every tick
+
+        :return: number of new records
+        """
+        for name in set(names).difference(self.exchanges):
+            self.__add_exchange(name)
+
+        columns = np.fromiter(map(self.exchanges.__getitem__, names), dtype=np.int64, count=len(names))
+        matrix = np.full((rows.max() + 1 if len(rows) else 0, len(self.exchanges)), np.nan)
+        matrix[rows, columns] = prices
+
+        return self.__push(self.__forward_fill(matrix))
+
+    def __forward_fill(self, matrix: np.ndarray) -> np.ndarray:
+        matrix = np.vstack([self.last_prices[None, :], matrix])
+        known = ~np.isnan(matrix)
+        index = np.where(known, np.arange(len(matrix))[:, None], 0)
+        np.maximum.accumulate(index, axis=0, out=index)
+        matrix = matrix[index, np.arange(matrix.shape[1])]
+        self.last_prices = matrix[-1].copy()
+
+        return matrix[1:]
+
+    def __add_exchange(self, name: str) -> int:
+        column = self.exchanges[name] = len(self.exchanges)
+        self.last_prices = np.append(self.last_prices, np.nan)
+        self.ring = np.pad(self.ring, ((0, 0), (0, 1)), constant_values=np.nan)
+        self.sums = np.pad(self.sums, ((0, 1), (0, 1)))
+        self.counts = np.pad(self.counts, ((0, 1), (0, 1)))
+
+        return column
+
+    def __push(self, matrix: np.ndarray) -> int:
+        new_records = len(matrix)
+        matrix = matrix[-self.window:]
+        position = (self.records + new_records - len(matrix)) % self.window
+        first = min(len(matrix), self.window - position)
+
+        for rows, at in ((matrix[:first], position), (matrix[first:], 0)):
+            if len(rows):
+                self.__accumulate(self.ring[at:at + len(rows)], -1)
+                self.__accumulate(rows, 1)
+                self.ring[at:at + len(rows)] = rows
+
+        self.records += new_records
+
+        return new_records
+
+    def __accumulate(self, rows: np.ndarray, sign: int) -> None:
+        for start in range(0, len(rows), self.BLOCK_RECORDS):
+            block = rows[start:start + self.BLOCK_RECORDS]
+            deviations = block[:, :, None] / block[:, None, :] - 1
+            known = ~np.isnan(deviations)
+            self.sums += sign * np.where(known, deviations, 0).sum(axis=0)
+            self.counts += sign * known.sum(axis=0)
+
+    def get_shifts(self) -> dict:
+        self.update()
+        gathering_time = min(self.records, self.window) / 240
+        means = np.divide(self.sums, self.counts, out=np.full(self.sums.shape, np.nan), where=self.counts > 0)
         shifts = {}
         print(f"Result for {gathering_time} hours")
 
-        for exchange in self.price_deviations[-1].keys():
-            try:
-                avg_deviation = sum([x[exchange] for x in self.price_deviations]) / self.list_len
-            except Exception as e:
-                traceback.print_exc()
-                avg_deviation = None
+        for name_1, i in self.exchanges.items():
+            for name_2, j in self.exchanges.items():
+                if i == j or np.isnan(means[i, j]):
+                    continue
 
-            shifts.update({exchange: round(avg_deviation, 6)})
+                shifts.update({name_1 + ' ' + name_2: round(float(means[i, j]), 6)})
 
         print(f"SHIFTS: {shifts}")
 
         return shifts
-
-
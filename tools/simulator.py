@@ -0,0 +1,294 @@
+import asyncio
+import itertools
+import math
+import random
+import time
+from collections import defaultdict, deque
+from types import MappingProxyType
+
+import aiohttp
+import orjson
+
+from core.base_client import BaseClient
+from core.enums import EventTypeEnum, PositionSideEnum
+from core.messages import JSON, decode, encode
+
+
+class RateLimitExceeded(aiohttp.ClientResponseError):
+    """
+    429 response of the simulated exchange
+    """
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(None, (), status=429, message=message,
+                         headers=MappingProxyType({'Retry-After': f'{retry_after:.3f}'}))
+
+    def __str__(self) -> str:
+        return f'429, {self.message}'
+
+
+class SimulatedExchange(BaseClient):
+    """
+    In-process exchange implementing BaseClient for benchmarks and local runs.
+
+    The orderbook is regenerated around `price` on every read (`depth` levels `tick` apart), orders
+    fill immediately against it up to their limit price and `fill_ratio` of the amount. The rest is
+    cancelled, or with `rest` stays open at its limit price and fills once the book moves through it,
+    each fill of an open order is sent to listeners as ORDER_TRADE_UPDATE. Every call waits a lognormal
+    latency, counts against a per-second rate limit and fails with ServerDisconnectedError with
+    probability `disconnect_rate`. The rate limit is a counter decaying by `rate_limit` per second that
+    rejects calls beyond `rate_burst` with a 429, like the Kraken and OKX limits, the calls it accepts
+    report the remaining budget to listeners in a RATE_LIMIT event. The client is async-native, like
+    every BaseClient only get_orderbook is sync.
+    """
+    def __init__(self, name: str, symbol: str = 'BTC', price: float = 30000.0, depth: int = 10, tick: float = 0.5,
+                 level_size: float = 1.0, taker_fee: float = 0.0005, latency: float = 0.002, jitter: float = 0.5,
+                 fill_ratio: float = 1.0, rate_limit: float = None, rate_burst: float = None,
+                 disconnect_rate: float = 0.0,
+                 balance: float = 100000.0, leverage: float = 2, rest: bool = False, seed: int = None):
+        """
+        :param latency: median seconds per call
+        :param jitter: sigma of the lognormal latency
+        :param rate_limit: sustained calls per second, unlimited by default
+        :param rate_burst: max calls at once, rate_limit by default
+        :param rest: keep unfilled orders open (GTC) instead of cancelling them (IOC)
+        """
+        self.EXCHANGE_NAME = name
+        self.symbol = symbol
+        self.price = price
+        self.depth = depth
+        self.tick = tick
+        self.level_size = level_size
+        self.taker_fee = taker_fee
+        self.latency = latency
+        self.jitter = jitter
+        self.fill_ratio = fill_ratio
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_limit if rate_burst is None else rate_burst
+        self.rate_counter = 0.0
+        self.rate_updated = 0.0
+        self.rejected = 0
+        self.disconnect_rate = disconnect_rate
+        self.balance = balance
+        self.leverage = leverage
+        self.rest = rest
+        self.position = 0.0
+        self.entry_price = 0.0
+        self.orders = {}
+        self.open_orders = {}
+        self.random = random.Random(seed)
+        self.order_ids = itertools.count(1)
+
+    FILL_FIELDS = 'status', 'factual_price', 'factual_amount_coin', 'factual_amount_usd', 'factual_fee'
+
+    def run_updater(self) -> None:
+        pass
+
+    def __count_call(self) -> dict:
+        """
+        :return: rate headers of the call
+        """
+        now = asyncio.get_event_loop().time()
+        self.rate_counter = max(self.rate_counter - (now - self.rate_updated) * self.rate_limit, 0)
+        self.rate_updated = now
+
+        if self.rate_counter + 1 > self.rate_burst:
+            self.rejected += 1
+            raise RateLimitExceeded(f'{self.EXCHANGE_NAME}: more than {self.rate_burst} calls at {self.rate_limit}/s',
+                                    (self.rate_counter + 1 - self.rate_burst) / self.rate_limit)
+
+        self.rate_counter += 1
+
+        return {'RateLimit-Remaining': str(int(self.rate_burst - self.rate_counter))}
+
+    async def __async_call(self) -> None:
+        self.__match()
+        headers = self.__count_call() if self.rate_limit is not None else None
+
+        if self.random.random() < self.disconnect_rate:
+            raise aiohttp.ServerDisconnectedError()
+
+        await asyncio.sleep(self.random.lognormvariate(math.log(self.latency), self.jitter) if self.latency else 0)
+
+        if headers is not None:
+            self.notify_listeners(EventTypeEnum.RATE_LIMIT, headers)
+
+    def trade(self, amount: float, price: float = None) -> None:
+        """
+        Change the position outside of the balancer, e.g. a fill of the arbitrage bot
+
+        :param amount: signed amount in coin
+        """
+        price = price or self.price
+
+        position = self.position + amount
+
+        if position and (self.position == 0 or (position > 0) != (self.position > 0)):
+            self.entry_price = price
+        elif abs(position) > abs(self.position):
+            self.entry_price = (self.entry_price * abs(self.position) + price * abs(amount)) / abs(position)
+
+        self.position = position
+
+    def __levels(self, side: str) -> list:
+        sign = 1 if side == 'asks' else -1
+        half_spread = self.tick / 2
+
+        return [[self.price + sign * (half_spread + i * self.tick), self.level_size * (1 + i)]
+                for i in range(self.depth)]
+
+    def __fill(self, side: str, price: float, amount: float) -> tuple:
+        levels = self.__levels('asks' if side == 'buy' else 'bids')
+        crosses = (lambda level: level <= price) if side == 'buy' else (lambda level: level >= price)
+        filled = cost = 0.0
+
+        for level_price, level_size in levels:
+            if filled >= amount or not crosses(level_price):
+                break
+
+            size = min(amount - filled, level_size)
+            filled += size
+            cost += size * level_price
+
+        if filled:
+            self.trade(filled if side == 'buy' else -filled, cost / filled)
+
+        return filled, cost
+
+    def __update(self, order_id: str, filled: float, cost: float) -> None:
+        order = self.orders[order_id]
+        order['factual_amount_coin'] += filled
+        order['factual_amount_usd'] += cost
+        order['factual_price'] = order['factual_amount_usd'] / order['factual_amount_coin']
+        order['ts'] = order['datetime'] = time.time()
+
+        if order['factual_amount_coin'] >= order['amount'] - 1e-12:
+            order['status'] = 'FILLED'
+            del self.open_orders[order_id]
+        else:
+            order['status'] = 'PARTIALLY_FILLED'
+
+    def __match(self) -> None:
+        for order_id, order in list(self.open_orders.items()):
+            filled, cost = self.__fill(order['side'], order['price'],
+                                       order['amount'] - self.orders[order_id]['factual_amount_coin'])
+
+            if filled:
+                self.__update(order_id, filled, cost)
+                self.notify_listeners(EventTypeEnum.ORDER_TRADE_UPDATE, dict(self.orders[order_id]))
+
+    def get_orderbook(self) -> dict:
+        self.__match()
+
+        return {self.symbol: {'asks': self.__levels('asks'), 'bids': self.__levels('bids'), 'timestamp': time.time()}}
+
+    async def get_last_price(self, side: str) -> float:
+        return self.__levels('asks' if side.lower() == 'buy' else 'bids')[0][0]
+
+    async def get_positions(self) -> dict:
+        await self.__async_call()
+
+        return {self.symbol: {
+            'side': PositionSideEnum.LONG if self.position >= 0 else PositionSideEnum.SHORT,
+            'amount': self.position,
+            'amount_usd': self.position * self.price,
+            'entry_price': self.entry_price
+        }}
+
+    async def get_real_balance(self) -> float:
+        await self.__async_call()
+
+        return self.balance
+
+    async def get_available_balance(self, side: str) -> float:
+        await self.__async_call()
+
+        exposure = self.position * self.price if side.lower() == 'buy' else -self.position * self.price
+
+        return max(self.balance * self.leverage - exposure, 0)
+
+    async def cancel_all_orders(self, orderID=None) -> dict:
+        await self.__async_call()
+        cancelled = [order_id for order_id in self.open_orders if orderID is None or order_id == orderID]
+
+        for order_id in cancelled:
+            del self.open_orders[order_id]
+            self.orders[order_id]['status'] = 'CANCELED'
+
+        return {'exchange': self.EXCHANGE_NAME, 'cancelled': len(cancelled)}
+
+    async def create_order(self, amount: float, price: float, side: str, session: aiohttp.ClientSession = None,
+                           expire: int = 100, client_ID: str = None) -> dict:
+        await self.__async_call()
+
+        side = side.lower()
+        order_id = f'{self.EXCHANGE_NAME}-{next(self.order_ids)}'
+        self.LAST_ORDER_ID = order_id
+        self.orders[order_id] = {
+            'exchange_order_id': order_id,
+            'exchange': self.EXCHANGE_NAME,
+            'status': 'NEW',
+            'symbol': self.symbol,
+            'side': side,
+            'amount': amount,
+            'factual_price': 0,
+            'factual_amount_coin': 0,
+            'factual_amount_usd': 0,
+            'factual_fee': self.taker_fee,
+            'datetime': time.time(),
+            'ts': time.time()
+        }
+        self.open_orders[order_id] = {'side': side, 'price': price, 'amount': amount}
+        filled, cost = self.__fill(side, price, amount * self.fill_ratio)
+
+        if filled:
+            self.__update(order_id, filled, cost)
+
+        if order_id in self.open_orders and not self.rest:
+            del self.open_orders[order_id]
+            self.orders[order_id]['status'] = 'CANCELED'
+
+        return {'exchange_name': self.EXCHANGE_NAME, 'exchange_order_id': order_id, 'timestamp': time.time(),
+                **{key: self.orders[order_id][key] for key in self.FILL_FIELDS}}
+
+    async def get_order_by_id(self, order_ids, session: aiohttp.ClientSession = None):
+        await self.__async_call()
+
+        if isinstance(order_ids, (list, tuple)):
+            return [dict(self.orders[order_id]) for order_id in order_ids if order_id in self.orders]
+
+        return dict(self.orders[order_ids]) if order_ids in self.orders else None
+
+
+class MemoryBroker:
+    """
+    In-memory stand-in for core.publisher.Publisher, messages are encoded like Publisher does and
+    kept per routing key as (body, content type, headers), the last `max_messages` of each
+    """
+    __slots__ = 'queues', 'published'
+
+    def __init__(self, max_messages: int = 100000):
+        self.queues = defaultdict(lambda: deque(maxlen=max_messages))
+        self.published = 0
+
+    async def publish(self, message, routing_key: str, exchange_name: str, queue_name: str) -> bool:
+        self.queues[routing_key].append((orjson.dumps(message), JSON, {}))
+        self.published += 1
+
+        return True
+
+    async def publish_batch(self, records: list, routing_key: str, exchange_name: str, queue_name: str,
+                            content_type: str = JSON) -> bool:
+        for body, headers in encode(records, content_type):
+            self.queues[routing_key].append((body, content_type, headers))
+            self.published += 1
+
+        return True
+
+    def messages(self, routing_key: str) -> list:
+        return [payload for message in self.queues[routing_key] for payload in decode(*message)]
+
+    async def reset(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,167 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import orjson
+
+from tools.shifts import Shifts, iter_record_chunks, parse_records
+
+TICK_DTYPE = np.dtype([('ts', '<f8'), ('exchange', '<u2'), ('price', '<f8')])
+
+
+class TickStore:
+    """
+    Append-only binary store of price ticks.
+
+    Every tick is a fixed-width (timestamp, exchange id, float64 price) record, exchange names are
+    kept in a `<path>.exchanges` sidecar. Ticks are appended in time order, reads memory-map the
+    file and locate time ranges by binary search over a sparse in-memory index, so a window is a
+    zero-copy view of the file.
+    """
+    INDEX_STEP = 4096
+
+    def __init__(self, path: str):
+        self.path = path
+        self.exchanges_path = f'{path}.exchanges'
+        self.exchanges = []
+
+        if os.path.exists(self.exchanges_path):
+            with open(self.exchanges_path, 'rb') as file:
+                self.exchanges = orjson.loads(file.read())
+
+        self.exchange_ids = {name: i for i, name in enumerate(self.exchanges)}
+        self.ticks = None
+        self.index = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Re-map the file to see ticks appended since the previous call
+        """
+        size = os.path.getsize(self.path) // TICK_DTYPE.itemsize if os.path.exists(self.path) else 0
+
+        if size:
+            self.ticks = np.memmap(self.path, dtype=TICK_DTYPE, mode='r', shape=(size,))
+        else:
+            self.ticks = np.zeros(0, dtype=TICK_DTYPE)
+
+        self.index = np.array(self.ticks['ts'][::self.INDEX_STEP])
+
+    def exchange_id(self, name: str) -> int:
+        exchange_id = self.exchange_ids.get(name)
+
+        if exchange_id is None:
+            exchange_id = self.exchange_ids[name] = len(self.exchanges)
+            self.exchanges.append(name)
+
+            with open(self.exchanges_path, 'wb') as file:
+                file.write(orjson.dumps(self.exchanges))
+
+        return exchange_id
+
+    def append(self, ts: np.ndarray, exchanges: list, prices: np.ndarray) -> None:
+        """
+        Append ticks, timestamps must not be older than the last stored tick
+
+        :param ts: unix timestamps in seconds
+        :param exchanges: exchange name of every tick
+        :param prices: float prices
+        """
+        for name in set(exchanges).difference(self.exchange_ids):
+            self.exchange_id(name)
+
+        ticks = np.empty(len(prices), dtype=TICK_DTYPE)
+        ticks['ts'] = ts
+        ticks['exchange'] = np.fromiter(map(self.exchange_ids.__getitem__, exchanges), dtype=np.uint16,
+                                        count=len(exchanges))
+        ticks['price'] = prices
+
+        if len(ticks) and len(self.ticks) and ticks['ts'][0] < self.ticks['ts'][-1]:
+            raise ValueError(f'Tick at {ticks["ts"][0]} is older than the last stored {self.ticks["ts"][-1]}')
+
+        if np.any(np.diff(ticks['ts']) < 0):
+            raise ValueError('Ticks must be sorted by timestamp')
+
+        with open(self.path, 'ab') as file:
+            file.write(ticks.tobytes())
+
+        self.refresh()
+
+    def __search(self, ts: float, side: str) -> int:
+        block = max(np.searchsorted(self.index, ts, side=side) - 1, 0) * self.INDEX_STEP
+        window = self.ticks['ts'][block:block + 2 * self.INDEX_STEP]
+
+        return block + int(np.searchsorted(window, ts, side=side))
+
+    def window(self, start: float = None, end: float = None) -> np.ndarray:
+        """
+        Zero-copy view of ticks with start <= ts < end
+
+        :param start: unix timestamp, beginning of the store by default
+        :param end: unix timestamp, end of the store by default
+        :return: structured array view with ts, exchange and price fields
+        """
+        first = 0 if start is None else self.__search(start, 'left')
+        last = len(self.ticks) if end is None else self.__search(end, 'left')
+
+        return self.ticks[first:last]
+
+    def records(self, start: float = None, end: float = None) -> tuple:
+        """
+        Ticks of a time window grouped into records, one record per distinct timestamp
+
+        :return: (record index of every tick, exchange names, prices) as accepted by Shifts.push
+        """
+        ticks = self.window(start, end)
+        rows = np.unique(ticks['ts'], return_inverse=True)[1]
+        names = np.asarray(self.exchanges, dtype=object)[ticks['exchange']].tolist()
+
+        return rows, names, ticks['price']
+
+    def shifts(self, start: float = None, end: float = None, window: int = 300000) -> Shifts:
+        """
+        Shifts over ticks of a time window
+        """
+        rows, names, prices = self.records(start, end)
+        shifts = Shifts(path=None, window=window)
+        shifts.push(names, rows, prices)
+
+        return shifts
+
+
+def convert_rates(rates_path: str, store_path: str, start: float, interval: float) -> int:
+    """
+    One-off conversion of rates.txt into a tick store, record i is stamped start + i * interval
+
+    :return: number of converted records
+    """
+    store = TickStore(store_path)
+    records = 0
+
+    for _, text in iter_record_chunks(rates_path):
+        rows, names, prices = parse_records(text)
+
+        if not len(rows):
+            continue
+
+        store.append(start + (records + rows) * interval, names, prices)
+        records += int(rows.max()) + 1
+
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert rates.txt into a binary tick store')
+    parser.add_argument('rates', help='path to rates.txt')
+    parser.add_argument('store', help='path to the tick store')
+    parser.add_argument('--start', type=float, default=None, help='timestamp of the first record, '
+                                                                  'by default records end now')
+    parser.add_argument('--interval', type=float, default=15, help='seconds between records')
+    args = parser.parse_args()
+
+    if args.start is None:
+        total = sum(len(np.unique(parse_records(text)[0])) for _, text in iter_record_chunks(args.rates))
+        args.start = time.time() - total * args.interval
+
+    print(f'Converted {convert_rates(args.rates, args.store, args.start, args.interval)} records')